@@ -0,0 +1,120 @@
+import json
+import os
+import time
+from typing import Dict, Iterator, List, Tuple
+import anthropic
+from client_pool import ClientPool
+
+# Message Batches API limit on the number of requests of one batch
+MAX_BATCH_REQUESTS = 100000
+
+
+def _request_body(params: Dict) -> Dict:
+    """messages.create arguments as the body of a batch request"""
+    body = {name: value for name, value in params.items() if name != 'extra_body'}
+    return {**body, **params.get('extra_body', {})}
+
+
+class BatchJob:
+    """
+    One Message Batches API submission whose id is persisted in a JSON state file.
+
+    Rerunning a job with an existing state file resumes polling the submitted batch
+    instead of paying for a second one. The batch is submitted with the pool's next
+    available key and polled with the same key, batches are only visible to their
+    workspace. The state file is removed once the results were consumed, see clear().
+    """
+
+    def __init__(self, pool: ClientPool, state_file: str, poll_interval: float = 60):
+        self.pool = pool
+        self.state_file = state_file
+        self.poll_interval = poll_interval
+        self.state = self._load_state()
+        self._key = None
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _save_state(self, state):
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_file, self.state_file)
+        self.state = state
+
+    @property
+    def batch_id(self):
+        return self.state['batch_id'] if self.state else None
+
+    @property
+    def client(self) -> anthropic.Client:
+        """Client of the key the batch was submitted with, the pool's next key for a new batch"""
+        if self._key is None:
+            name = self.state.get('key') if self.state else None
+            self._key = next((key for key in self.pool.keys if key.name == name), None) or self.pool.acquire()
+        return self._key.client
+
+    def submit(self, requests: List[Dict]) -> str:
+        """
+        Submit {"custom_id": ..., "params": <messages.create arguments>} requests as one batch,
+        unless the state file already holds a batch with all of these custom ids. A rerun that
+        only needs part of the submitted requests, the others being done, resumes that batch
+        and skips the results it does not need.
+        """
+        custom_ids = [request['custom_id'] for request in requests]
+        if self.state:
+            unknown = set(custom_ids) - set(self.state['custom_ids'])
+            if unknown:
+                raise ValueError(f"{self.state_file} holds batch {self.batch_id} without {len(unknown)} of the "
+                                 f"requests, remove it to submit a new batch")
+            print(f"Resuming batch {self.batch_id}")
+            return self.batch_id
+        if len(requests) > MAX_BATCH_REQUESTS:
+            raise ValueError(f"{len(requests)} requests exceed the batch limit of {MAX_BATCH_REQUESTS}")
+        self._key = self.pool.acquire()
+        # a batch request holds the request body itself, extra_body fields go in it
+        requests = [{**request, 'params': _request_body(request['params'])} for request in requests]
+        batch = self.client.messages.batches.create(requests=requests)
+        self._save_state({'batch_id': batch.id, 'custom_ids': custom_ids, 'key': self._key.name,
+                          'submitted_at': time.time()})
+        print(f"Submitted batch {batch.id} with {len(requests)} requests")
+        return batch.id
+
+    def wait(self, timeout: float = None):
+        """Poll the batch until it ended, transient API errors are retried at the next poll"""
+        start = time.monotonic()
+        while True:
+            try:
+                batch = self.client.messages.batches.retrieve(self.batch_id)
+                if batch.processing_status == 'ended':
+                    return batch
+                counts = batch.request_counts
+                print(f"Batch {self.batch_id} {batch.processing_status} : {counts.processing} processing, "
+                      f"{counts.succeeded} succeeded, {counts.errored} errored")
+            except (anthropic.APIConnectionError, anthropic.InternalServerError, anthropic.RateLimitError) as e:
+                print(f"Error polling batch {self.batch_id}: {e}")
+            if timeout is not None and time.monotonic() - start > timeout:
+                raise TimeoutError(f"Batch {self.batch_id} did not end within {timeout} seconds")
+            time.sleep(self.poll_interval)
+
+    def results(self) -> Iterator[Tuple[str, str, str]]:
+        """(custom_id, response text, None) for succeeded requests, (custom_id, None, reason) for the others"""
+        for entry in self.client.messages.batches.results(self.batch_id):
+            result = entry.result
+            if result.type == 'succeeded':
+                yield entry.custom_id, result.message.content[0].text, None
+            elif result.type == 'errored':
+                yield entry.custom_id, None, f"errored: {result.error.error.message}"
+            else:
+                yield entry.custom_id, None, result.type
+
+    def clear(self):
+        """Forget the batch once its results were written"""
+        if os.path.exists(self.state_file):
+            os.remove(self.state_file)
+        self.state = None
+        self._key = None
@@ -0,0 +1,114 @@
+import json
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+BOILERPLATE_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'boilerplate_rules.json')
+
+# headers : running headers / footers, stripped from the raw page text
+# boilerplate : subscription notices, contact details ... stripped from the cleaned text
+STAGES = ('headers', 'boilerplate')
+RULE_FLAGS = set('imsx')
+
+# anchor is an optional lower case literal every match of the pattern contains
+Rule = namedtuple('Rule', ['publication', 'stage', 'pattern', 'flags', 'anchor'])
+
+
+def _case_insensitive_view(text):
+    """Lower case copy of the text in which IGNORECASE regex matches can be looked up as literals"""
+    if text.isascii():
+        return text.lower()
+    # non-ASCII letters re.IGNORECASE matches to ASCII ones but lower() does not map to them
+    return (text.replace('\u0130', 'i').lower()
+            .replace('\u0131', 'i').replace('\u017f', 's').replace('\u212a', 'k'))
+
+
+def _rule_regex(rule):
+    return f'(?{rule.flags}:{rule.pattern})' if rule.flags else f'(?:{rule.pattern})'
+
+
+class RuleSet:
+    """
+    Header, footer and boilerplate rules of one or more publications.
+
+    For each stage the rules that can match a page (no anchor, or anchor found in a
+    lower case copy of the page) are combined into one alternation, so the page is
+    scanned once whatever the number of publications. Overlapping matches are
+    resolved leftmost first, then in rule order. Combined patterns are compiled once
+    per set of active rules.
+    """
+
+    def __init__(self, rules):
+        self.rules = {stage: tuple(rule for rule in rules if rule.stage == stage) for stage in STAGES}
+        self._matchers = {}
+
+    def _matcher(self, active):
+        matcher = self._matchers.get(active)
+        if matcher is None:
+            matcher = self._matchers[active] = re.compile('|'.join(_rule_regex(rule) for rule in active))
+        return matcher
+
+    def strip(self, text, stage):
+        """Remove every match of the stage's rules in a single pass over the text"""
+        lowered = None
+        active = []
+        for rule in self.rules[stage]:
+            if rule.anchor:
+                if lowered is None:
+                    lowered = _case_insensitive_view(text)
+                if rule.anchor not in lowered:
+                    continue
+            active.append(rule)
+        if not active:
+            return text
+        return self._matcher(tuple(active)).sub('', text)
+
+    def strip_headers(self, text):
+        return self.strip(text, 'headers')
+
+    def strip_boilerplate(self, text):
+        return self.strip(text, 'boilerplate')
+
+
+def _parse_rules(config, publications=None):
+    rules = []
+    for publication, stages in config.items():
+        if publications and publication not in publications:
+            continue
+        for stage, entries in stages.items():
+            if stage not in STAGES:
+                raise ValueError(f"Unknown stage '{stage}' for {publication}, expected one of {STAGES}")
+            for entry in entries:
+                flags = entry.get('flags', '')
+                if not set(flags) <= RULE_FLAGS:
+                    raise ValueError(f"Invalid flags '{flags}' in {stage} rule of {publication}")
+                rule = Rule(publication, stage, entry['pattern'], flags, entry.get('anchor', '').lower() or None)
+                try:
+                    re.compile(_rule_regex(rule))
+                except re.error as e:
+                    raise ValueError(f"Invalid pattern in {stage} rule of {publication}: {e}")
+                rules.append(rule)
+    return rules
+
+
+@lru_cache(maxsize=None)
+def _load_rule_set(path, publications):
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    return RuleSet(_parse_rules(config, publications))
+
+
+def load_rule_set(path=BOILERPLATE_RULES_PATH, publications=None):
+    """
+    Load and compile a JSON rule file, once per process for a given path and publications.
+
+    The file maps publication names to stages ('headers', 'boilerplate'), each a list of rules :
+        {"pattern": <regex>, "flags": <subset of 'imsx'>, "anchor": <literal every match contains>}
+    Patterns are combined with other rules, so they must not use numbered backreferences.
+
+    Args:
+        path (str): Rule file path
+        publications (list): Only load rules of these publications (default: all)
+    """
+    return _load_rule_set(os.path.abspath(path), tuple(publications) if publications else None)
@@ -1,8 +1,8 @@
-from nltk.stem import WordNetLemmatizer
-from nltk.corpus import wordnet, words
+from nltk.corpus import wordnet
 import enchant
 from nltk.tag import pos_tag
 from name_checker import *
+from lexicon_index import get_lexicon
 import logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s')
 
@@ -14,8 +14,7 @@ logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %
 
 def get_word_forms(word):
     """Get different forms of a word including tenses and participles"""
-    lemmatizer = WordNetLemmatizer()
-    base = lemmatizer.lemmatize(word, wordnet.VERB)
+    base = get_lexicon().verb_lemma(word)
     
     forms = {word, base}
     
@@ -47,7 +46,7 @@ def validate_join(word1, word2):
     validations = []
     combined = word1 + word2
     logging.info(f"combined word : {combined}") 
-    word_set = set(words.words())  # Using NLTK words instead of enchant
+    lexicon = get_lexicon()  # NLTK words and WordNet forms, loaded once per process
     
     possible_forms = get_word_forms(combined)
     
@@ -58,20 +57,20 @@ def validate_join(word1, word2):
       validations.append(f"Valid English word : {combined}" if is_valid else f"Invalid English word {combined}")
     
     # check if it is a name 
-    checker = NameChecker()
+    checker = get_name_checker()
     is_name, confidence, method = checker.is_likely_name(combined.lower())
     logging.info(f" is_likely_name: {is_name} confidence = {confidence} method ={method}")
     if (is_name == True):
       validations.append( f"Valid English name {combined}" )
     
     # Check if any word form exists in NLTK words
-    nltk_word = any(form.lower() in word_set for form in possible_forms)
+    nltk_word = any(lexicon.in_words(form.lower()) for form in possible_forms)
     logging.info(f" part of nltk_word set : {nltk_word}")
     if ( nltk_word == True):
       validations.append(f"inside nltk word set : {combined}" )
         
     # Check if any form exists in WordNet
-    nltk_wordnet = any(wordnet.synsets(form) for form in possible_forms)
+    nltk_wordnet = any(lexicon.in_wordnet(form) for form in possible_forms)
     logging.info(f" part of nltk_wordnet : {nltk_wordnet}")
     if ( nltk_wordnet == True):
       validations.append(f"inside nltk wordnet : {combined}" )
@@ -79,19 +78,114 @@ def validate_join(word1, word2):
     logging.info(f"len of validations {len(validations)}")
     return len(validations) > 0, validations
 
+class WordBoundaryRepairer:
+    """
+    Join incorrectly split words over a whole page in one linear pass.
+
+    Join decisions follow validate_join (valid english word, likely name, NLTK word list
+    or WordNet form of the combined word) but are made against the lexicon index without
+    logging, and are remembered per (word1, word2) pair so repeated pairs cost a dict lookup.
+    """
+
+    def __init__(self, skip_dictionary_pairs=False, max_cached_pairs=200000):
+        """
+        Args:
+            skip_dictionary_pairs (bool): never join two tokens that are both dictionary words
+                                          (e.g. 'some thing'). Off by default to keep the
+                                          join semantics of validate_join
+            max_cached_pairs (int): upper bound on remembered pair decisions
+        """
+        self.skip_dictionary_pairs = skip_dictionary_pairs
+        self.max_cached_pairs = max_cached_pairs
+        self.name_checker = get_name_checker()
+        self._decisions = {}
+
+    def _is_dictionary_word(self, lexicon, word):
+        return lexicon.in_words(word.lower()) or lexicon.in_wordnet(word)
+
+    def _resolve(self, word1, word2):
+        """Decide if two tokens should be joined, cheapest checks first"""
+        lexicon = get_lexicon()
+        if (self.skip_dictionary_pairs and self._is_dictionary_word(lexicon, word1)
+                and self._is_dictionary_word(lexicon, word2)):
+            return False
+
+        combined = word1 + word2
+        if lexicon.in_wordnet(combined.lower()):
+            return True
+
+        possible_forms = get_word_forms(combined)
+        if any(lexicon.in_words(form.lower()) or lexicon.in_wordnet(form) for form in possible_forms):
+            return True
+
+        # the name checker only accepts letters, skip it for digits and punctuation
+        if combined.isalpha():
+            is_name, _, _ = self.name_checker.is_likely_name(combined.lower())
+            return is_name
+        return False
+
+    def resolve_pairs(self, pairs):
+        """Resolve a batch of (word1, word2) candidate pairs, skipping already known ones"""
+        if len(self._decisions) > self.max_cached_pairs:
+            self._decisions.clear()
+        for pair in pairs:
+            if pair not in self._decisions:
+                self._decisions[pair] = self._resolve(*pair)
+
+    def should_join(self, word1, word2):
+        pair = (word1, word2)
+        decision = self._decisions.get(pair)
+        if decision is None:
+            # joined words checked against the next token were not resolved in advance
+            if len(self._decisions) >= self.max_cached_pairs:
+                self._decisions.clear()
+            decision = self._decisions[pair] = self._resolve(word1, word2)
+        return decision
+
+    def _join_tokens(self, tokens):
+        """Greedy left to right join, a joined word is checked again against the next token"""
+        if not tokens:
+            return []
+        joined = []
+        current = tokens[0]
+        for token in tokens[1:]:
+            if self.should_join(current, token):
+                current += token
+            else:
+                joined.append(current)
+                current = token
+        joined.append(current)
+        return joined
+
+    def repair_tokens(self, tokens):
+        """Join incorrectly split words in a list of tokens"""
+        self.resolve_pairs(zip(tokens, tokens[1:]))
+        return self._join_tokens(tokens)
+
+    def repair_page(self, text):
+        """
+        Join incorrectly split words in a page of text. Lines are kept as they are
+        (words are never joined across a line break) and spacing within a line is
+        normalized, as process_incorrect_words does for a single line.
+        """
+        token_lines = [line.split() for line in text.split('\n')]
+        # tokenize the page once and resolve every adjacent pair in one batch
+        self.resolve_pairs(pair for tokens in token_lines for pair in zip(tokens, tokens[1:]))
+        return '\n'.join(' '.join(self._join_tokens(tokens)) for tokens in token_lines)
+
+
+_repairer = None
+
+def get_repairer():
+    """Return the process wide WordBoundaryRepairer"""
+    global _repairer
+    if _repairer is None:
+        _repairer = WordBoundaryRepairer()
+    return _repairer
+
 def process_incorrect_words(text):
     """Clean text by joining incorrectly split words"""
-    words = text.split()
-    i = 0
-    
-    while i < len(words) - 1:
-        result ,_ = validate_join(words[i], words[i+1])
-        if result:
-            words[i:i+2] = [''.join(words[i:i+2])]
-        else:
-            i += 1
-    
-    return ' '.join(words)
+    return ' '.join(get_repairer().repair_tokens(text.split()))
 
 def is_valid_english_word(word):
     """
@@ -129,17 +223,8 @@ def is_valid_english_word_ver2(word):
     """get the valid english word using 
        base form of the word and check if it is in wordnet
     """
-    # Get base form using lemmatizer
-    lemmatizer = WordNetLemmatizer()
-    base_word = lemmatizer.lemmatize(word, 'v')  # Try verb form
-    
-    # Check original and base form
-    has_synset = bool(wordnet.synsets(word)) or bool(wordnet.synsets(base_word))
-    
-    # Also try lemmatizing as noun in case it's not a verb
-    base_noun = lemmatizer.lemmatize(word, 'n')
-    has_synset = has_synset or bool(wordnet.synsets(base_noun))
-    
-    return has_synset
+    # The lexicon holds every inflected form WordNet's morphy can reduce to a lemma,
+    # so checking the word covers its verb and noun base forms as well
+    return get_lexicon().in_wordnet(word)
 
 
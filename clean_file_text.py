@@ -1,16 +1,87 @@
-from check_word_boundary import * 
-def clean_file_text(file_name):
-    base_name = file_name.split("\\")[-1]  
-    with open(file_name,"r") as f:
-        fw = open(f".\\clean_text\\{base_name}","a")
+from check_word_boundary import *
+from file_util import list_files_with_extension
+from concurrent.futures import ProcessPoolExecutor
+import os
+import re
+import time
+
+
+def _init_worker():
+    """Load the lexicon index and name checker once per worker process"""
+    get_lexicon()
+    get_repairer()
+
+def _clean_block(lines):
+    """Join incorrectly split words in a block of lines, each output line ends with a newline"""
+    text = ''.join(lines)
+    if not text:
+        return ''
+    cleaned = get_repairer().repair_page(text)
+    return cleaned if text.endswith('\n') else cleaned + '\n'
+
+def _write_atomic(output_file, text):
+    """Write to a temporary file and move it in place so readers never see a partial page"""
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as fw:
+        fw.write(text)
+    os.replace(tmp_file, output_file)
+
+def _page_sort_key(file_name):
+    """Sort page_2.txt before page_10.txt"""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', file_name)]
+
+def clean_file_text(file_name, output_dir="clean_text"):
+    base_name = os.path.basename(file_name)
+    with open(file_name,"r",encoding="utf-8") as f:
         lines = f.readlines()
-        for line in lines:
-            #print(line)
-            #print(f"processed line : {process_incorrect_words(line)}" )
-            fw.write(process_incorrect_words(line))
-            fw.write("\n")
-        fw.close()
-    
+    os.makedirs(output_dir, exist_ok=True)
+    _write_atomic(os.path.join(output_dir, base_name), _clean_block(lines))
+
+def clean_directory(input_dir, output_dir="clean_text", workers=None, block_lines=200):
+    """
+    Clean every .txt page of a directory in parallel.
+
+    Pages are split into blocks of lines and fanned out across a process pool, each
+    worker loads the NLTK / enchant / name resources once. Cleaned pages are written
+    atomically, in page order, as soon as all of their blocks are done.
+
+    Args:
+        input_dir (str): Directory with extracted page text files
+        output_dir (str): Directory to write cleaned pages to
+        workers (int): Number of worker processes (default: number of CPUs)
+        block_lines (int): Large pages are split into blocks of this many lines
+
+    Returns:
+        dict: pages, seconds and pages_per_sec of the run
+    """
+    start = time.perf_counter()
+    file_names = sorted(list_files_with_extension(input_dir, '.txt'), key=_page_sort_key)
+    os.makedirs(output_dir, exist_ok=True)
+
+    blocks = []
+    block_counts = []
+    for file_name in file_names:
+        with open(os.path.join(input_dir, file_name), "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        page_blocks = [lines[i:i + block_lines] for i in range(0, len(lines), block_lines)] or [[]]
+        blocks.extend(page_blocks)
+        block_counts.append(len(page_blocks))
+
+    # build or load the lexicon index once here: forked workers inherit it and spawned
+    # ones load the pickle instead of all building it at once on a cold cache
+    get_lexicon()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        # map keeps submission order, so blocks come back page by page
+        results = executor.map(_clean_block, blocks, chunksize=max(1, len(blocks) // (4 * (workers or os.cpu_count() or 1))))
+        for file_name, count in zip(file_names, block_counts):
+            page_text = ''.join(next(results) for _ in range(count))
+            _write_atomic(os.path.join(output_dir, file_name), page_text)
+
+    seconds = time.perf_counter() - start
+    pages_per_sec = len(file_names) / seconds if seconds > 0 else 0.0
+    print(f"Cleaned {len(file_names)} pages in {seconds:.1f}s ({pages_per_sec:.2f} pages/sec)")
+    return {'pages': len(file_names), 'seconds': seconds, 'pages_per_sec': pages_per_sec}
+
 
 if __name__ == "__main__":
-    clean_file_text(".\\extracted_text\\page_16.txt")
\ No newline at end of file
+    clean_directory("extracted_text", "clean_text", workers=os.cpu_count())
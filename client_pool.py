@@ -0,0 +1,171 @@
+import asyncio
+import itertools
+import os
+import time
+from typing import List, Union
+import anthropic
+from rate_limit import RateLimiter, retry_after_seconds
+
+
+def load_api_keys(env_name: str = "ANTHROPIC_API_KEY", max_keys: int = 5) -> List[str]:
+    """API keys from env_name, env_name2 ... env_name<max_keys> (the .env layout), skipping unset ones"""
+    names = [env_name] + [f"{env_name}{i}" for i in range(2, max_keys + 1)]
+    return [os.environ[name] for name in names if os.environ.get(name)]
+
+
+class KeyState:
+    """Client, cooldown and request counters of one API key"""
+
+    def __init__(self, api_key: str, base_url: str = None):
+        self.api_key = api_key
+        self.base_url = base_url
+        # SDK retries are off, the pool retries on another key instead
+        self.client = anthropic.Client(api_key=api_key, base_url=base_url, max_retries=0)
+        self.async_client = None
+        self.limiter = None
+        self.cooldown_until = 0.0
+        self.consecutive_errors = 0
+        self.disabled = False
+        self.requests = 0
+        self.successes = 0
+        self.rate_limited = 0
+        self.errors = 0
+
+    @property
+    def name(self) -> str:
+        return f"...{self.api_key[-4:]}"
+
+    def stats(self) -> dict:
+        return {'key': self.name, 'requests': self.requests, 'successes': self.successes,
+                'rate_limited': self.rate_limited, 'errors': self.errors,
+                'error_rate': (self.rate_limited + self.errors) / self.requests if self.requests else 0.0,
+                'disabled': self.disabled}
+
+
+class ClientPool:
+    """
+    Round robin over several Anthropic API keys.
+
+    A key answering 429 cools down for the server's retry-after delay, a key failing with
+    connection or server errors backs off exponentially, and a key rejected as invalid is
+    dropped. Requests go to the next key that is not cooling down, so one throttled key
+    does not stall the others.
+    """
+
+    def __init__(self, api_keys: Union[str, List[str]] = None, base_url: str = None, max_backoff: float = 60):
+        if isinstance(api_keys, str):
+            api_keys = [api_keys]
+        if not api_keys:
+            # no key given, read them from the environment as anthropic.Client(api_key=None) would
+            api_keys = load_api_keys()
+        if not api_keys:
+            raise ValueError("ClientPool needs at least one API key, none given and ANTHROPIC_API_KEY is not set")
+        self.keys = [KeyState(api_key, base_url) for api_key in api_keys]
+        self.max_backoff = max_backoff
+        self._order = itertools.cycle(self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _next_key(self):
+        """Next available key in round robin order, or (None, seconds until a key is available)"""
+        available = [state for state in self.keys if not state.disabled]
+        if not available:
+            raise RuntimeError("All API keys of the pool were rejected")
+        now = time.monotonic()
+        for _ in range(len(self.keys)):
+            state = next(self._order)
+            if not state.disabled and state.cooldown_until <= now:
+                return state, 0.0
+        return None, min(state.cooldown_until for state in available) - now
+
+    def acquire(self) -> KeyState:
+        """Next available key, sleeping while every key cools down"""
+        while True:
+            state, delay = self._next_key()
+            if state is not None:
+                return state
+            time.sleep(delay)
+
+    async def aacquire(self) -> KeyState:
+        while True:
+            state, delay = self._next_key()
+            if state is not None:
+                return state
+            await asyncio.sleep(delay)
+
+    def report_success(self, state: KeyState):
+        state.requests += 1
+        state.successes += 1
+        state.consecutive_errors = 0
+
+    def report_error(self, state: KeyState, error: Exception) -> bool:
+        """Record a failed request, returns True if it is worth retrying on another key"""
+        state.requests += 1
+        if isinstance(error, anthropic.RateLimitError):
+            state.rate_limited += 1
+            state.cooldown_until = time.monotonic() + retry_after_seconds(error.response.headers)
+            return True
+        state.errors += 1
+        if isinstance(error, (anthropic.AuthenticationError, anthropic.PermissionDeniedError)):
+            state.disabled = True
+            return True
+        if isinstance(error, (anthropic.APIConnectionError, anthropic.InternalServerError)):
+            state.consecutive_errors += 1
+            state.cooldown_until = time.monotonic() + min(self.max_backoff, 2 ** state.consecutive_errors)
+            return True
+        return False
+
+    def create_message(self, max_attempts: int = 5, **params):
+        """messages.create on the next available key, retried on another key after a retryable error"""
+        for attempt in range(1, max_attempts + 1):
+            state = self.acquire()
+            try:
+                response = state.client.messages.create(**params)
+            except anthropic.APIError as e:
+                if not self.report_error(state, e) or attempt == max_attempts:
+                    raise
+                continue
+            self.report_success(state)
+            return response
+
+    def set_rate_limits(self, requests_per_minute: float, tokens_per_minute: float):
+        """Give every key its own requests / tokens per minute limiter (quotas are per key)"""
+        for state in self.keys:
+            state.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+
+    async def acreate_message(self, reserved_tokens: int = 0, max_attempts: int = 5, **params):
+        """
+        Async create_message. When rate limits are set, the request first reserves
+        reserved_tokens in its key's limiter and settles them with the reported usage.
+        """
+        for attempt in range(1, max_attempts + 1):
+            state = await self.aacquire()
+            if state.limiter is not None:
+                await state.limiter.acquire(reserved_tokens)
+            if state.async_client is None:
+                state.async_client = anthropic.AsyncAnthropic(api_key=state.api_key, base_url=state.base_url,
+                                                              max_retries=0)
+            try:
+                response = await state.async_client.messages.create(**params)
+            except BaseException as e:
+                if state.limiter is not None:
+                    # a failed or cancelled request used no tokens, its reservation is given back
+                    state.limiter.settle(reserved_tokens, 0)
+                if not isinstance(e, anthropic.APIError) or not self.report_error(state, e) or attempt == max_attempts:
+                    raise
+                continue
+            self.report_success(state)
+            if state.limiter is not None:
+                state.limiter.settle(reserved_tokens, response.usage.input_tokens + response.usage.output_tokens)
+            return response
+
+    async def aclose(self):
+        """Close the async clients, their connections belong to the event loop that opened them"""
+        for state in self.keys:
+            if state.async_client is not None:
+                await state.async_client.close()
+                state.async_client = None
+
+    def stats(self) -> List[dict]:
+        return [state.stats() for state in self.keys]
@@ -1,50 +1,198 @@
-from context_inst_gen import * 
-from dotenv import load_dotenv
 import re
+import logging
+from boilerplate_rules import load_rule_set
+from lexicon_index import get_lexicon
+
+# Bump whenever cleaning output changes, cached cleaned pages of older versions are ignored
+CLEANER_VERSION = "3"
+
+HYPHENATION_PATTERN = re.compile(r'(\w+)-\s*\n*\s*(\w+)')
+DIGIT_PATTERN = re.compile(r'\d')
+
+# Mis-decoded UTF-8 and typographic characters
+CHAR_REPLACEMENTS = {
+    'â€™': "'",
+    'â€˜': "'",
+    'â€œ': '"',
+    'â€': '"',
+    '\u2019': "'",
+    '\u2018': "'",
+    '\u201c': '"',
+    '\u201d': '"'
+}
+DASH_REPLACEMENTS = {
+    '\u2013': '-',  # en dash
+    '\u2014': '-'   # em dash
+}
+
+TRANSITION_PATTERN = re.compile(r'^(However|Moreover|Furthermore|In addition|Meanwhile|Still|Thus|Therefore|As a result|Consequently|First|Second|Finally|The|This)')
+
+
+def collapse_whitespace(text):
+    """Same result as re.sub(r"\\s+", " ", text), str.split is several times faster"""
+    collapsed = ' '.join(text.split())
+    if not collapsed:
+        return ' ' if text else ''
+    if text[0].isspace():
+        collapsed = ' ' + collapsed
+    if text[-1].isspace():
+        collapsed = collapsed + ' '
+    return collapsed
+
+
+class HyphenationResolver:
+    """
+    Decide if a word hyphenated across a line break is one word or a hyphenated compound
+    by looking up the joined and hyphenated forms in the lexicon index ; the heuristics of
+    handle_hyphenation only decide when the lexicon does not. Decisions are cached per
+    (part1, part2) pair, so a pair seen anywhere in the corpus is resolved once.
+    """
+
+    def __init__(self, lexicon=None, max_cached_pairs=100000):
+        self._lexicon = lexicon
+        self._lexicon_loaded = lexicon is not None
+        self.max_cached_pairs = max_cached_pairs
+        self._decisions = {}
+
+    @property
+    def lexicon(self):
+        if not self._lexicon_loaded:
+            self._lexicon_loaded = True
+            try:
+                self._lexicon = get_lexicon()
+            except LookupError as e:
+                # NLTK corpora not installed, fall back to the heuristics
+                logging.warning(f"lexicon index unavailable, hyphenation uses heuristics only : {e}")
+        return self._lexicon
+
+    def _is_known(self, word):
+        lexicon = self.lexicon
+        return lexicon.in_wordnet(word) or lexicon.in_words(word) or lexicon.in_words(word.lower())
+
+    def _decide(self, part1, part2):
+        combined = part1 + part2
+        hyphenated = part1 + '-' + part2
+        if self.lexicon is not None:
+            joined_known = self._is_known(combined)
+            # WordNet lists hyphenated compounds such as 'well-known'
+            hyphenated_known = self.lexicon.in_wordnet(hyphenated)
+            if joined_known and not hyphenated_known:
+                return combined
+            if hyphenated_known and not joined_known:
+                return hyphenated
+            if not joined_known and self._is_known(part1) and self._is_known(part2):
+                return hyphenated
+        return _hyphenation_heuristics(part1, part2)
+
+    def resolve(self, part1, part2):
+        """Return the joined or hyphenated form of part1-part2"""
+        pair = (part1, part2)
+        decision = self._decisions.get(pair)
+        if decision is None:
+            if len(self._decisions) >= self.max_cached_pairs:
+                self._decisions.clear()
+            decision = self._decisions[pair] = self._decide(part1, part2)
+        return decision
+
+    def resolve_page(self, text, pattern=HYPHENATION_PATTERN):
+        """Resolve every hyphenation match of a page in one pass, same result as pattern.sub"""
+        pieces = []
+        last = 0
+        for match in pattern.finditer(text):
+            pieces.append(text[last:match.start()])
+            pieces.append(self.resolve(match.group(1), match.group(2)))
+            last = match.end()
+        if not pieces:
+            return text
+        pieces.append(text[last:])
+        return ''.join(pieces)
+
+
+_hyphenation_resolver = None
+
+def get_hyphenation_resolver():
+    """Return the process wide HyphenationResolver"""
+    global _hyphenation_resolver
+    if _hyphenation_resolver is None:
+        _hyphenation_resolver = HyphenationResolver()
+    return _hyphenation_resolver
+
+
+class TextNormalizer:
+    """
+    Cleaning steps of clean_text and clean_text2 with every pattern compiled once.
+    Headers, footers and boilerplate are removed with a RuleSet loaded from
+    boilerplate_rules.json (all publications unless given).
+    """
+
+    def __init__(self, rules=None):
+        # str.replace is a C level scan, looping over the small table beats a
+        # per-character str.translate or a combined regex alternation
+        self.char_replacements = tuple(CHAR_REPLACEMENTS.items())
+        self.char_and_dash_replacements = tuple({**CHAR_REPLACEMENTS, **DASH_REPLACEMENTS}.items())
+        self.rules = rules if rules is not None else load_rule_set()
+        self.sentence_break = re.compile(r'\.(?:\s+)([A-Z])')
+
+    def fix_characters(self, text, replacements):
+        for old, new in replacements:
+            text = text.replace(old, new)
+        return text
+
+    def remove_boilerplate(self, text):
+        return self.rules.strip_boilerplate(text)
+
+    def clean_text2(self, text):
+        text = self.rules.strip_headers(text)
+        text = self.fix_characters(text, self.char_and_dash_replacements)
+        text = get_hyphenation_resolver().resolve_page(text)
+        text = collapse_whitespace(text)
+        text = self.sentence_break.sub('.\n\n\\1', text)
+        text = self.remove_boilerplate(text)
+        return text.strip()
+
+    def clean_text(self, text):
+        text = self.rules.strip_headers(text)
+        text = self.fix_characters(text, self.char_replacements)
+        text = get_hyphenation_resolver().resolve_page(text)
+
+        paragraphs = []
+        current_para = []
+        for sentence in text.split('. '):
+            # strip and collapse whitespace runs, same as re.sub(r'\s+', ' ', sentence.strip())
+            sentence = ' '.join(sentence.split())
+            if not sentence:
+                continue
+            # sentences hold no newlines once whitespace is collapsed, so a transition
+            # word is the only paragraph break indicator left
+            if current_para and TRANSITION_PATTERN.match(sentence):
+                paragraphs.append(' '.join(current_para))
+                current_para = []
+            current_para.append(sentence)
+
+        if current_para:
+            paragraphs.append(' '.join(current_para))
+
+        # paragraphs never start or end with whitespace, joining them is already standardized
+        return '\n\n'.join(paragraphs)
+
+
+_normalizer = TextNormalizer()
 
 def clean_text2(text):
     """
     Comprehensive text cleaning for PDF extracted text
     Handles headers, special characters, hyphenation, and spacing
     """
-    # Step 1: Remove headers/footers
-    text = re.sub(r'\d{1,2}\s+INDIA TODAY\s+[A-Z]+\s+\d{1,2},\s+\d{4}', '', text)
-    
-    # Step 2: Fix special characters encoding
-    char_replacements = {
-        'â€™': "'",
-        'â€˜': "'",
-        'â€œ': '"',
-        'â€': '"',
-        '\u2019': "'",
-        '\u2018': "'",
-        '\u201c': '"',
-        '\u201d': '"',
-        '\u2013': '-',  # en dash
-        '\u2014': '-'   # em dash
-    }
-    for old, new in char_replacements.items():
-        text = text.replace(old, new)
-    
-    # Step 3: Fix hyphenated words split across lines
-    text = re.sub(r'(\w+)-\s*\n*\s*(\w+)', lambda m: handle_hyphenation(m.group(1), m.group(2)), text)
-    
-    # Step 4: Fix spacing and line breaks
-    # Remove multiple spaces
-    text = re.sub(r'\s+', ' ', text)
-    
-    # Step 5: Fix paragraph breaks
-    # Add proper breaks after sentences that end paragraphs
-    text = re.sub(r'\.(?:\s+)([A-Z])', '.\n\n\\1', text)
-    
-    # Step 6: Clean boilerplate content
-    text = remove_boilerplate(text)
-    
-    # Final cleanup
-    text = text.strip()
-    return text
+    return _normalizer.clean_text2(text)
 
 def handle_hyphenation(part1, part2):
+    """
+    Handle hyphenated words, checking the lexicon first and falling back to
+    general linguistic patterns rather than hardcoded lists
+    """
+    return get_hyphenation_resolver().resolve(part1, part2)
+
+def _hyphenation_heuristics(part1, part2):
     """
     Handle hyphenated words using general linguistic patterns rather than hardcoded lists
     """
@@ -56,7 +204,7 @@ def handle_hyphenation(part1, part2):
         return combined
     
     # Rule 2: Check for compound numbers or number-word combinations
-    if re.search(r'\d', hyphenated):
+    if DIGIT_PATTERN.search(hyphenated):
         return hyphenated
         
     # Rule 3: Check syllable boundaries
@@ -79,92 +227,17 @@ def handle_hyphenation(part1, part2):
 
 def remove_boilerplate(text):
     """Remove common magazine boilerplate text"""
-    boilerplate_patterns = [
-        r'FOR SUBSCRIPTION ASSISTANCE.*',
-        r'SCAN HERE TO SUBSCRIBE.*',
-        r'E-MAIL.*?@.*?\.com',
-        r'Customer Care,.*',
-        r'Readers are recommended.*?commitments.*',
-        r'www\..*?\.(?:com|in)',
-        r'Phone\s*/\s*Whatsapp:.*'
-    ]
-    
-    for pattern in boilerplate_patterns:
-        text = re.sub(pattern, '', text, flags=re.IGNORECASE | re.DOTALL)
-    
-    return text
+    return _normalizer.remove_boilerplate(text)
 
 def clean_text(text):
     """Clean and format PDF extracted text using natural text patterns"""
-    
-    # Remove header/footer type content
-    text = re.sub(r'\d{1,2}\s+INDIA TODAY\s+[A-Z]+\s+\d{1,2},\s+\d{4}', '', text)
-    
-    # Fix special characters encoding
-    char_replacements = {
-        'â€™': "'",
-        'â€˜': "'",
-        'â€œ': '"',
-        'â€': '"',
-        '\u2019': "'",
-        '\u2018': "'",
-        '\u201c': '"',
-        '\u201d': '"'
-    }
-    for old, new in char_replacements.items():
-        text = text.replace(old, new)
-    
-     # Step 3: Fix hyphenated words split across lines
-    text = re.sub(r'(\w+)-\s*\n*\s*(\w+)', lambda m: handle_hyphenation(m.group(1), m.group(2)), text)
-   
-    
-    # Clean up excessive whitespace while preserving paragraph breaks
-    # Look for patterns like capital letter after period and double line breaks
-    sentences = text.split('. ')
-    cleaned_sentences = []
-    
-    for sentence in sentences:
-        # Remove extra spaces
-        sentence = re.sub(r'\s+', ' ', sentence.strip())
-        cleaned_sentences.append(sentence)
-    
-    # Join sentences with proper spacing
-    text = '. '.join(cleaned_sentences)
-    
-    # Add paragraph breaks using natural indicators:
-    # 1. Double line breaks in original text
-    # 2. Significant topic shifts (detected by looking at sentence beginnings)
-    paragraphs = []
-    current_para = []
-    
-    for sentence in cleaned_sentences:
-        if sentence:
-            # Start new paragraph if:
-            # - Previous sentence ended with multiple newlines
-            # - Current sentence starts with transition words
-            transition_patterns = r'^(However|Moreover|Furthermore|In addition|Meanwhile|Still|Thus|Therefore|As a result|Consequently|First|Second|Finally|The|This)'
-            
-            if (current_para and 
-                (re.search(r'\n\s*\n', current_para[-1]) or 
-                 re.search(transition_patterns, sentence.strip()))):
-                paragraphs.append(' '.join(current_para))
-                current_para = []
-            
-            current_para.append(sentence.strip())
-    
-    if current_para:
-        paragraphs.append(' '.join(current_para))
-    
-    # Join paragraphs with double newlines
-    text = '\n\n'.join(paragraphs)
-    
-    # Final cleanup
-    text = re.sub(r'\s*\n\s*\n\s*', '\n\n', text)  # Standardize paragraph spacing
-    text = text.strip()
-    
-    return text
+    return _normalizer.clean_text(text)
 
 '''
+import os
+from dotenv import load_dotenv
+from context_inst_gen import ContextualInstructionGenerator
+
 load_dotenv()
 API_KEY = os.getenv("ANTHROPIC_API_KEY")
 generator = ContextualInstructionGenerator(API_KEY)
@@ -1,62 +1,278 @@
-import spacy
-import anthropic
+import asyncio
 import json
-from typing import List, Dict
+from itertools import groupby
+from typing import List, Dict, Iterable, Iterator, Tuple, Union, Callable
 from tqdm import tqdm
 import time
 from tenacity import retry, wait_exponential, stop_after_attempt
 from dotenv import load_dotenv
 import os   
+from client_pool import ClientPool, load_api_keys
+from batch_job import BatchJob
+from run_manifest import RunManifest
+from response_cache import ResponseCache
+from pair_parser import parse_pairs, flatten_pairs
+
+# Pipeline components chunking never uses (it needs sentences, noun chunks and entities), disabled
+# while chunking ; every other component stays on, e.g. a sentencizer or the transformer of the
+# trf pipelines that the tagger, parser and ner listen to
+UNUSED_CHUNKING_COMPONENTS = {'lemmatizer', 'textcat', 'textcat_multilabel'}
+# Components of the small English pipelines
+SPACY_COMPONENTS = ('tok2vec', 'tagger', 'parser', 'senter', 'attribute_ruler', 'lemmatizer', 'ner')
+
+GENERATION_MODEL = "claude-3-sonnet-20240229"
+GENERATION_MAX_TOKENS = 2000
+# The prompt asks for 2-3 pairs, fewer parsed pairs are topped up with a follow-up request
+MIN_PAIRS = 2
+
+PAIR_FORMAT = """Return each pair in this exact format, with one pair per line:
+[{"role": "user", "content": "instruction1"}, {"role": "assistant", "content": "response1"}]
+[{"role": "user", "content": "instruction2"}, {"role": "assistant", "content": "response2"}]
+
+Important:
+- Each pair must be a complete list with exactly two dictionaries
+- Use double quotes for strings
+- Each pair must be on its own line
+- Make instructions natural and varied
+- Responses should be detailed and based only on the provided text"""
+
+def load_token_counter(encoding_name: str = "cl100k_base") -> Callable[[str], int]:
+    """
+    Token counter backed by a local tiktoken encoding. Claude's tokenizer is not available
+    locally, cl100k_base is a close enough budget. Falls back to ~4 characters per token
+    when tiktoken or its encoding file is not available.
+    """
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding(encoding_name)
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception as e:
+        print(f"Tokenizer {encoding_name} unavailable ({e}), estimating 4 characters per token")
+        return lambda text: (len(text) + 3) // 4
+
+def _split_paragraphs(text: str) -> List[tuple]:
+    """Paragraphs of a text as (start offset in text, stripped paragraph)"""
+    paragraphs = []
+    offset = 0
+    for part in text.split('\n\n'):
+        para = part.strip()
+        if para:
+            paragraphs.append((offset + len(part) - len(part.lstrip()), para))
+        offset += len(part) + 2
+    return paragraphs
+
+def _iter_documents(documents: Union[str, Iterable[Tuple[str, str]]]) -> Iterator[Tuple[str, str]]:
+    """(doc_id, text) pairs from a directory of .txt files (doc_id is the file name) or an iterable"""
+    if not isinstance(documents, str):
+        yield from documents
+        return
+    file_names = sorted(name for name in os.listdir(documents) if name.endswith('.txt'))
+    for file_name in file_names:
+        with open(os.path.join(documents, file_name), 'r', encoding='utf-8') as f:
+            yield file_name, f.read()
+
+def _with_source(messages: List[Dict], chunk: Dict) -> List[Dict]:
+    """Messages of a chunk's pairs, user messages carry the chunk text as "source" for the judge's pre-screen"""
+    return [{**message, 'source': chunk['text']} if message['role'] == 'user' else message for message in messages]
+
+def iter_chunk_store(path: str) -> Iterator[Dict]:
+    """Stream chunk records back from a JSONL chunk store written by chunk_corpus."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
 
 class ContextualInstructionGenerator:
-    def __init__(self, api_key: str):
-        # Initialize spaCy for text processing
-        self.nlp = spacy.load("en_core_web_sm")
-        self.client = anthropic.Client(api_key=api_key)
+    def __init__(self, api_key: Union[str, List[str], ClientPool], spacy_model: str = "en_core_web_sm",
+                 components: List[str] = None, base_url: str = None, cache: ResponseCache = None,
+                 bypass_cache: bool = False):
+        """
+        Args:
+            api_key: Anthropic API key, a list of keys to spread requests over, or a ClientPool
+            spacy_model: spaCy pipeline used for chunking, loaded on first use
+            components: Only load these pipeline components (default: the full pipeline), e.g.
+                        ['senter', 'ner'] for fast sentence splitting with entity topics only,
+                        or ['tagger', 'attribute_ruler', 'parser', 'ner'] for noun phrase topics
+            base_url: Anthropic API endpoint (default: the SDK's, e.g. a local stub server in tests)
+            cache: Serve responses to prompts already sent from this cache and store new ones (optional)
+            bypass_cache: Always call the API, still storing the fresh responses in the cache
+        """
+        self.spacy_model = spacy_model
+        self.components = components
+        self._nlp = None
+        self.pool = api_key if isinstance(api_key, ClientPool) else ClientPool(api_key, base_url=base_url)
+        self.cache = cache
+        self.bypass_cache = bypass_cache
+        self._count_tokens = None
+
+    @property
+    def nlp(self):
+        """spaCy pipeline, loaded on first chunking call so construction stays cheap"""
+        if self._nlp is None:
+            self._nlp = self._load_pipeline()
+        return self._nlp
+
+    def _load_pipeline(self):
+        import spacy
+        if self.components is None:
+            return spacy.load(self.spacy_model)
+        # tok2vec feeds the tagger, parser and ner of the small English pipelines
+        keep = set(self.components) | {'tok2vec'}
+        nlp = spacy.load(self.spacy_model, exclude=[name for name in SPACY_COMPONENTS if name not in keep])
+        # senter ships disabled, the parser sets sentence boundaries by default
+        if 'senter' in keep and 'senter' in nlp.disabled:
+            nlp.enable_pipe('senter')
+        return nlp
         
-    def create_contextual_chunks(self, text: str, max_chunk_size: int = 2000) -> List[Dict]:
-        """Create chunks while preserving context and semantic meaning."""
-        doc = self.nlp(text)
+    @property
+    def count_tokens(self) -> Callable[[str], int]:
+        if self._count_tokens is None:
+            self._count_tokens = load_token_counter()
+        return self._count_tokens
+
+    def create_contextual_chunks(self, text: str, max_chunk_size: int = 2000, batch_size: int = 64,
+                                 size_unit: str = 'chars', overlap_sentences: int = 1,
+                                 fill_ratio: float = 1.0) -> List[Dict]:
+        """
+        Create chunks while preserving context and semantic meaning.
+
+        Args:
+            text: Text to chunk
+            max_chunk_size: Maximum chunk size, in size_unit
+            batch_size: Number of paragraphs per spaCy batch
+            size_unit: 'chars' or 'tokens' (model tokens, see load_token_counter)
+            overlap_sentences: Number of trailing sentences repeated at the start of the next chunk,
+                               with long sentences the overlap can take a chunk past the budget
+            fill_ratio: Fill chunks up to this fraction of max_chunk_size, leaving room for the prompt
+        """
+        # Process text paragraph by paragraph, each paragraph is parsed exactly once
+        paragraphs = _split_paragraphs(text)
+        disable = [name for name in self.nlp.pipe_names if name in UNUSED_CHUNKING_COMPONENTS]
+        para_docs = self.nlp.pipe((para for _, para in paragraphs), batch_size=batch_size, disable=disable)
+
+        sentences = []
+        for (offset, _), para_doc in zip(paragraphs, para_docs):
+            sentences.extend(self._sentence_records(para_doc, offset))
+        return self._build_chunks(sentences, max_chunk_size, size_unit, overlap_sentences, fill_ratio)
+
+    def chunk_corpus(self, documents: Union[str, Iterable[Tuple[str, str]]], output_file: str,
+                     max_chunk_size: int = 2000, n_process: int = 1, batch_size: int = 64,
+                     size_unit: str = 'chars', overlap_sentences: int = 1, fill_ratio: float = 1.0) -> Dict:
+        """
+        Chunk a whole corpus and stream chunk records to a JSONL chunk store.
+
+        Paragraphs of all documents go through a single nlp.pipe, parsed on n_process cores,
+        and chunks of a document are written as soon as its last paragraph is parsed. Each
+        record holds doc_id, chunk_index, start / end offsets in the document, text, size and topics.
+
+        Args:
+            documents: Directory of .txt files, or an iterable of (doc_id, text)
+            output_file: JSONL chunk store to write (overwritten)
+            max_chunk_size: Maximum chunk size, in size_unit
+            n_process: Number of processes spaCy parses with
+            batch_size: Number of paragraphs per spaCy batch
+            size_unit, overlap_sentences, fill_ratio: see create_contextual_chunks
+        """
+        # paragraphs carry their document's position, documents sharing a doc_id stay apart
+        paragraphs = ((para, (position, doc_id, offset))
+                      for position, (doc_id, text) in enumerate(_iter_documents(documents))
+                      for offset, para in _split_paragraphs(text))
+        disable = [name for name in self.nlp.pipe_names if name in UNUSED_CHUNKING_COMPONENTS]
+        parsed = self.nlp.pipe(paragraphs, as_tuples=True, n_process=n_process, batch_size=batch_size,
+                               disable=disable)
+
+        num_docs = 0
+        num_chunks = 0
+        with open(output_file, 'w', encoding='utf-8') as f:
+            # nlp.pipe keeps input order, so paragraphs of a document arrive together
+            for (_, doc_id), doc_paragraphs in groupby(parsed, key=lambda item: item[1][:2]):
+                sentences = []
+                for para_doc, (_, _, offset) in doc_paragraphs:
+                    sentences.extend(self._sentence_records(para_doc, offset))
+                chunks = self._build_chunks(sentences, max_chunk_size, size_unit, overlap_sentences, fill_ratio)
+                for chunk_index, chunk in enumerate(chunks):
+                    f.write(json.dumps({'doc_id': doc_id, 'chunk_index': chunk_index, **chunk},
+                                       ensure_ascii=False) + '\n')
+                    num_chunks += 1
+                num_docs += 1
+
+        print(f"Chunked {num_docs} documents into {num_chunks} chunks, saved to {output_file}")
+        return {'documents': num_docs, 'chunks': num_chunks}
+
+    def _sentence_records(self, doc, offset: int = 0) -> List[Dict]:
+        """Sentences of a parsed paragraph with their character offsets and the topics they contain."""
+        # noun phrases and named entities, assigned to the sentence they start in
+        sent_topics = {}
+        # a pipeline loaded without the parser gives entity topics only
+        noun_chunks = doc.noun_chunks if doc.has_annotation("DEP") else []
+        for chunk in noun_chunks:
+            if chunk.root.pos_ in ['NOUN', 'PROPN']:
+                sent_topics.setdefault(chunk.sent.start, []).append(chunk.text.lower())
+        for ent in doc.ents:
+            sent_topics.setdefault(ent.sent.start, []).append(ent.text.lower())
+
+        records = []
+        for sent in doc.sents:
+            start = offset + sent.start_char + len(sent.text) - len(sent.text.lstrip())
+            sent_text = sent.text.strip()
+            records.append({
+                'text': sent_text,
+                'start': start,
+                'end': start + len(sent_text),
+                'topics': sent_topics.get(sent.start, [])
+            })
+        return records
+
+    def _make_chunk(self, sentences: List[Dict], size: int) -> Dict:
+        topics = set()
+        for sentence in sentences:
+            topics.update(sentence['topics'])
+        return {
+            'text': ' '.join(sentence['text'] for sentence in sentences),
+            'size': size,
+            'topics': list(topics),
+            'start': sentences[0]['start'],
+            'end': sentences[-1]['end']
+        }
+
+    def _build_chunks(self, sentences: List[Dict], max_chunk_size: int, size_unit: str = 'chars',
+                      overlap_sentences: int = 1, fill_ratio: float = 1.0) -> List[Dict]:
+        """Group sentence records into chunks, sizes are tracked per sentence without re-joining."""
+        if size_unit not in ('chars', 'tokens'):
+            raise ValueError(f"size_unit must be 'chars' or 'tokens', got {size_unit}")
+        if not 0 < fill_ratio <= 1:
+            raise ValueError(f"fill_ratio must be in (0, 1], got {fill_ratio}")
+        measure = len if size_unit == 'chars' else self.count_tokens
+        budget = max_chunk_size * fill_ratio
+
         chunks = []
         current_chunk = []
+        current_sizes = []
         current_size = 0
-        
-        # Process text paragraph by paragraph
-        paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
-        
-        for para in paragraphs:
-            para_doc = self.nlp(para)
-            para_sentences = list(para_doc.sents)
-            
-            for sent in para_sentences:
-                sent_text = sent.text.strip()
-                sent_size = len(sent_text)
-                
-                # If adding this sentence would exceed chunk size
-                if current_size + sent_size > max_chunk_size and current_chunk:
-                    # Store current chunk with metadata
-                    chunk_text = ' '.join(current_chunk)
-                    chunks.append({
-                        'text': chunk_text,
-                        'size': current_size,
-                        'topics': self.extract_topics(chunk_text)
-                    })
-                    # Start new chunk with overlap (last sentence)
-                    current_chunk = [current_chunk[-1]] if current_chunk else []
-                    current_size = len(' '.join(current_chunk))
-                
-                current_chunk.append(sent_text)
-                current_size += sent_size
-        
+
+        for sentence in sentences:
+            sent_size = measure(sentence['text'])
+
+            # If adding this sentence would exceed chunk size
+            if current_size + sent_size > budget and current_chunk:
+                # Store current chunk with metadata
+                chunks.append(self._make_chunk(current_chunk, current_size))
+                # Start new chunk with overlap (last sentences). A chunk of several sentences always
+                # drops at least one so it never repeats as a whole, a one sentence chunk is carried
+                # over as the original single sentence overlap did
+                keep = min(overlap_sentences, max(1, len(current_chunk) - 1)) if overlap_sentences > 0 else 0
+                current_chunk = current_chunk[len(current_chunk) - keep:]
+                current_sizes = current_sizes[len(current_sizes) - keep:]
+                current_size = sum(current_sizes)
+
+            current_chunk.append(sentence)
+            current_sizes.append(sent_size)
+            current_size += sent_size
+
         # Add the last chunk if it exists
         if current_chunk:
-            chunk_text = ' '.join(current_chunk)
-            chunks.append({
-                'text': chunk_text,
-                'size': current_size,
-                'topics': self.extract_topics(chunk_text)
-            })
-        
+            chunks.append(self._make_chunk(current_chunk, current_size))
+
         return chunks
 
     def extract_topics(self, text: str) -> List[str]:
@@ -75,60 +291,255 @@ class ContextualInstructionGenerator:
         # Remove duplicates and return
         return list(set(topics))
 
-    @retry(wait=wait_exponential(multiplier=1, min=4, max=60), stop=stop_after_attempt(3))
-    def generate_instructions(self, chunk: Dict) -> List[Dict]:
-        """Generate instruction-response pairs using Claude API."""
-        prompt = f"""Generate 2-3 high-quality instruction-response pairs based on this text. The instructions should be natural questions or tasks, and responses should be detailed and helpful.
+    def _build_prompt(self, chunk: Dict) -> str:
+        return f"""Generate 2-3 high-quality instruction-response pairs based on this text. The instructions should be natural questions or tasks, and responses should be detailed and helpful.
 
 Text: {chunk['text']}
 
 Main topics: {', '.join(chunk['topics'])}
 
-Return each pair in this exact format, with one pair per line:
-[{{"role": "user", "content": "instruction1"}}, {{"role": "assistant", "content": "response1"}}]
-[{{"role": "user", "content": "instruction2"}}, {{"role": "assistant", "content": "response2"}}]
+{PAIR_FORMAT}"""
 
-Important:
-- Each pair must be a complete list with exactly two dictionaries
-- Use double quotes for strings
-- Each pair must be on its own line
-- Make instructions natural and varied
-- Responses should be detailed and based only on the provided text"""
+    def _build_followup_prompt(self, chunk: Dict, pairs: List[Tuple[Dict, Dict]], missing: int) -> str:
+        written = '\n'.join(f"- {user['content']}" for user, _ in pairs)
+        return f"""Generate {missing} more high-quality instruction-response pairs based on this text. The instructions should be natural questions or tasks, and responses should be detailed and helpful.
+
+Text: {chunk['text']}
+
+Main topics: {', '.join(chunk['topics'])}
+
+These instructions were already written, do not repeat them:
+{written}
+
+{PAIR_FORMAT}"""
+
+    def _message_params(self, prompt: str) -> Dict:
+        # temperature is sent in the request body, recent SDK releases no longer accept it as an argument
+        return {'model': GENERATION_MODEL, 'max_tokens': GENERATION_MAX_TOKENS, 'extra_body': {'temperature': 0.7},
+                'messages': [{"role": "user", "content": prompt}]}
+
+    def _parse_pairs(self, text: str) -> List[Tuple[Dict, Dict]]:
+        """Every complete pair of a response, a response without any is an error"""
+        pairs = parse_pairs(text)
+        if not pairs:
+            raise ValueError(f"No instruction-response pair in response: {text[:200]!r}")
+        return pairs
 
-        response = self.client.messages.create(
-            model="claude-3-sonnet-20240229",
-            max_tokens=2000,
-            temperature=0.7,
-            messages=[{"role": "user", "content": prompt}]
-        )
+    def _cached_response(self, params: Dict):
+        return self.cache.get(params) if self.cache is not None and not self.bypass_cache else None
+
+    def _store_response(self, params: Dict, text: str) -> List[Tuple[Dict, Dict]]:
+        # parse first so a response without any pair is retried rather than cached
+        pairs = self._parse_pairs(text)
+        if self.cache is not None:
+            self.cache.put(params, 0, text)
+        return pairs
+
+    def _request_pairs(self, prompt: str) -> List[Tuple[Dict, Dict]]:
+        params = self._message_params(prompt)
+        text = self._cached_response(params)
+        if text is not None:
+            return self._parse_pairs(text)
+        response = self.pool.create_message(**params)
         print(f"response from api : {response.content[0].text}")
-        # Parse and return the response
-        return eval(response.content[0].text)
+        # Rate limiting, one request per second and per key (cache hits are not held back)
+        time.sleep(1 / len(self.pool))
+        return self._store_response(params, response.content[0].text)
+
+    async def _arequest_pairs(self, prompt: str) -> List[Tuple[Dict, Dict]]:
+        params = self._message_params(prompt)
+        text = self._cached_response(params)
+        if text is not None:
+            return self._parse_pairs(text)
+        # reserve the worst case, the difference is given back once usage is known
+        response = await self.pool.acreate_message(
+            reserved_tokens=self.count_tokens(prompt) + GENERATION_MAX_TOKENS, **params)
+        return self._store_response(params, response.content[0].text)
+
+    @retry(wait=wait_exponential(multiplier=1, min=4, max=60), stop=stop_after_attempt(3))
+    def generate_instructions(self, chunk: Dict) -> List[Dict]:
+        """Generate instruction-response pairs using Claude API.
 
-    def process_text(self, text: str, output_file: str):
-        """Process entire text and generate instruction dataset."""
+        Complete pairs are kept from a malformed or cut off response, when fewer than MIN_PAIRS
+        were parsed only the missing pairs are requested. Only a response without any pair is
+        retried. Returns the pairs as alternating user / assistant messages, user messages
+        carry the chunk text as "source".
+        """
+        pairs = self._request_pairs(self._build_prompt(chunk))
+        if len(pairs) < MIN_PAIRS:
+            try:
+                pairs += self._request_pairs(self._build_followup_prompt(chunk, pairs, MIN_PAIRS - len(pairs)))
+            except Exception as e:
+                print(f"Keeping {len(pairs)} pairs, requesting the missing ones failed: {e}")
+        return _with_source(flatten_pairs(pairs), chunk)
+
+    async def agenerate_instructions(self, chunk: Dict) -> List[Dict]:
+        """
+        Async generate_instructions through the client pool. A 429 cools its key down for the
+        server's retry-after delay and the request moves on to the next key.
+        """
+        pairs = await self._arequest_pairs(self._build_prompt(chunk))
+        if len(pairs) < MIN_PAIRS:
+            try:
+                pairs += await self._arequest_pairs(self._build_followup_prompt(chunk, pairs, MIN_PAIRS - len(pairs)))
+            except Exception as e:
+                print(f"Keeping {len(pairs)} pairs, requesting the missing ones failed: {e}")
+        return _with_source(flatten_pairs(pairs), chunk)
+
+    async def aprocess_chunks(self, chunks: List[Dict], output_file: str, concurrency: int = 8,
+                              requests_per_minute: float = 50, tokens_per_minute: float = 40000) -> Dict:
+        """
+        Generate instructions for chunks concurrently, at most concurrency requests in flight
+        and within the requests / tokens per minute quota of each API key. Pairs are appended
+        to output_file as each chunk completes, so the file is not in chunk order. Chunks done
+        by an earlier run on the same output file are skipped, see process_text.
+
+        Returns:
+            dict: chunks, skipped, failed, pairs and seconds of the run, keys with per key request stats
+        """
+        self.pool.set_rate_limits(requests_per_minute, tokens_per_minute)
+        semaphore = asyncio.Semaphore(concurrency)
+        start = time.perf_counter()
+
+        async def run(key, chunk):
+            async with semaphore:
+                try:
+                    return key, await self.agenerate_instructions(chunk), None
+                except Exception as e:
+                    return key, None, e
+
+        manifest = RunManifest(output_file)
+        todo = manifest.start(chunks)
+        tasks = [asyncio.ensure_future(run(key, chunk)) for key, chunk in todo]
+        stats = {'chunks': len(chunks), 'skipped': len(chunks) - len(todo), 'failed': 0, 'pairs': 0}
+        try:
+            for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Generating instructions"):
+                key, instructions, error = await task
+                if error is not None:
+                    print(f"Error processing chunk: {error}")
+                    manifest.fail(key, error)
+                    stats['failed'] += 1
+                    continue
+                manifest.commit(key, instructions)
+                stats['pairs'] += len(instructions)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await self.pool.aclose()
+            manifest.close()
+        stats['seconds'] = time.perf_counter() - start
+        stats['keys'] = self.pool.stats()
+        return stats
+
+    def process_text_async(self, text: str, output_file: str, **kwargs) -> Dict:
+        """process_text with concurrent requests, see aprocess_chunks for the scheduling options"""
+        print("Creating contextual chunks...")
+        chunks = self.create_contextual_chunks(text)
+        print(f"Created {len(chunks)} chunks")
+        return asyncio.run(self.aprocess_chunks(chunks, output_file, **kwargs))
+
+    def process_chunks_batch(self, chunks: List[Dict], output_file: str, state_file: str = None,
+                             poll_interval: float = 60, timeout: float = None) -> Dict:
+        """
+        Generate instructions for every chunk in one Message Batches API submission (half the
+        price of individual calls, results within 24 hours). The batch id is kept in state_file
+        (default: <output_file>.batch.json) so an interrupted run resumes polling the same batch.
+        Pairs are appended to output_file in chunk order once the batch ended. Only chunks not
+        done by an earlier run on the same output file and not in the response cache are submitted,
+        see process_text. Responses with fewer than MIN_PAIRS pairs are kept as they are, there
+        is no follow-up request in batch mode.
+
+        Returns:
+            dict: batch_id, chunks, skipped, failed and pairs of the run
+        """
+        manifest = RunManifest(output_file)
+        try:
+            todo = manifest.start(chunks)
+            stats = {'batch_id': None, 'chunks': len(chunks), 'skipped': len(chunks) - len(todo), 'failed': 0,
+                     'pairs': 0}
+            if not todo:
+                return stats
+
+            # requests are named by chunk hash, so a rerun with fewer pending chunks resumes the batch
+            pairs = {}
+            requests = []
+            for key, chunk in todo:
+                params = self._message_params(self._build_prompt(chunk))
+                cached = self._cached_response(params)
+                if cached is not None:
+                    pairs[key] = _with_source(flatten_pairs(self._parse_pairs(cached)), chunk)
+                else:
+                    requests.append({'custom_id': key, 'params': params})
+
+            job = BatchJob(self.pool, state_file or f"{output_file}.batch.json", poll_interval)
+            if requests:
+                stats['batch_id'] = job.submit(requests)
+                job.wait(timeout)
+                params = {request['custom_id']: request['params'] for request in requests}
+                todo_chunks = dict(todo)
+                for custom_id, text, error in job.results():
+                    if custom_id not in params:
+                        # done by the interrupted run that submitted the batch
+                        continue
+                    try:
+                        if error:
+                            raise RuntimeError(error)
+                        pairs[custom_id] = _with_source(flatten_pairs(self._store_response(params[custom_id], text)),
+                                                        todo_chunks[custom_id])
+                    except Exception as e:
+                        print(f"Error processing chunk {custom_id}: {e}")
+                        manifest.fail(custom_id, e)
+                        stats['failed'] += 1
+            # commit in chunk order
+            for key, _ in todo:
+                if key in pairs:
+                    manifest.commit(key, pairs[key])
+                    stats['pairs'] += len(pairs[key])
+            job.clear()
+            return stats
+        finally:
+            manifest.close()
+
+    def process_text_batch(self, text: str, output_file: str, **kwargs) -> Dict:
+        """process_text through the Message Batches API, see process_chunks_batch for the options"""
+        print("Creating contextual chunks...")
+        chunks = self.create_contextual_chunks(text)
+        print(f"Created {len(chunks)} chunks")
+        return self.process_chunks_batch(chunks, output_file, **kwargs)
+
+    def process_text(self, text: str, output_file: str) -> Dict:
+        """Process entire text and generate instruction dataset.
+
+        The run is checkpointed in <output_file>.manifest.sqlite3 : each chunk's pairs are
+        appended and synced before the chunk is marked done, so rerunning after a crash or
+        on failed chunks only generates the chunks that are not done yet.
+        """
         # Create chunks
         print("Creating contextual chunks...")
         chunks = self.create_contextual_chunks(text)
         print(f"Created {len(chunks)} chunks")
-        
+
+        manifest = RunManifest(output_file)
+        todo = manifest.start(chunks)
+        if len(todo) < len(chunks):
+            print(f"Skipping {len(chunks) - len(todo)} chunks done by an earlier run")
+
         # Process each chunk and save results
-        with open(output_file, 'a', encoding='utf-8') as f:
-            for chunk in tqdm(chunks, desc="Generating instructions"):
-                try:
-                    # Generate instructions for this chunk
-                    instructions = self.generate_instructions(chunk)
-                    
-                    # Write to JSONL file
-                    for item in instructions:
-                        f.write(json.dumps(item, ensure_ascii=False) + '\n')
-                    
-                    # Rate limiting
-                    time.sleep(1)
-                    
-                except Exception as e:
-                    print(f"Error processing chunk: {e}")
-                    continue
+        for key, chunk in tqdm(todo, desc="Generating instructions"):
+            try:
+                # Generate instructions for this chunk
+                instructions = self.generate_instructions(chunk)
+
+                # Write to JSONL file
+                manifest.commit(key, instructions)
+
+            except Exception as e:
+                print(f"Error processing chunk: {e}")
+                manifest.fail(key, e)
+                continue
+        summary = manifest.summary()
+        manifest.close()
+        return summary
 
 def main():
     # Example usage
@@ -155,8 +566,7 @@ arrests. Whatever the truth, there’s no doubt that Bangladesh continues to be
 and its Hindus live in fear and anxiety
     """
     load_dotenv()
-    API_KEY = os.getenv("ANTHROPIC_API_KEY")
-    generator = ContextualInstructionGenerator(API_KEY)
+    generator = ContextualInstructionGenerator(load_api_keys())
     generator.process_text(text, 'instructions.jsonl')
 
 if __name__ == "__main__":
@@ -1,68 +1,221 @@
 import fitz
 import os
-from context_inst_file import clean_text
+import re
+from collections import namedtuple, Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from context_inst_file import clean_text, get_hyphenation_resolver, CLEANER_VERSION
+from page_cache import PageCache, file_hash
 
-def extract_text_from_pdf(pdf_path, from_page=None, to_page=None, output_dir=None):
+# One extracted page : 1-based page number, text as returned by fitz and cleaned text
+PageText = namedtuple('PageText', ['page_number', 'raw_text', 'cleaned_text'])
+
+# fitz document opened once in each worker process
+_worker_doc = None
+
+def _init_page_worker(pdf_path):
+    global _worker_doc
+    _worker_doc = fitz.open(pdf_path)
+
+def _page_pool(pdf_path, workers):
+    """
+    Process pool of page workers. The lexicon index used to resolve hyphenation is built or
+    loaded here first: forked workers inherit it and spawned ones load the pickle instead of
+    all building it at once on a cold cache.
+    """
+    get_hyphenation_resolver().lexicon
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_page_worker, initargs=(pdf_path,))
+
+def _extract_page(doc, page_index):
+    """Extract and clean a single page (0-based index)"""
+    text = doc[page_index].get_text("text")  # Use 'text' mode for better formatting
+    return PageText(page_index + 1, text, clean_text(text))
+
+def _extract_worker_page(page_index):
+    return _extract_page(_worker_doc, page_index)
+
+# Bump when layout extraction changes (2 : repeated blocks are found over the whole document)
+LAYOUT_VERSION = "2"
+
+# Hyphen at the end of a line followed by the rest of the word on the next line
+LINE_END_HYPHEN = re.compile(r'(\w+)-[ \t]*\n[ \t]*(\w+)')
+DIGITS = re.compile(r'\d+')
+
+def _page_blocks(doc, page_index):
+    """Text blocks of a page as (x0, y0, x1, y1, text), in fitz reading order"""
+    return [block[:5] for block in doc[page_index].get_text("blocks") if block[6] == 0]
+
+def _extract_worker_blocks(page_index):
+    return _page_blocks(_worker_doc, page_index)
+
+def _block_signature(block, tolerance=5):
+    """Position (rounded to tolerance points) and text with page numbers masked out"""
+    x0, y0, x1, y1, text = block
+    return (round(x0 / tolerance), round(y0 / tolerance), round(x1 / tolerance), round(y1 / tolerance),
+            DIGITS.sub('#', ' '.join(text.split())))
+
+def find_repeated_blocks(page_blocks, min_pages=3, min_ratio=0.3):
+    """
+    Signatures of blocks found at the same position with the same text (page numbers aside)
+    on at least min_pages pages and min_ratio of all pages : running headers and footers.
+    """
+    counts = Counter()
+    for blocks in page_blocks:
+        counts.update({_block_signature(block) for block in blocks})
+    threshold = max(min_pages, min_ratio * len(page_blocks))
+    return {signature for signature, count in counts.items() if count >= threshold}
+
+def _join_line_hyphens(text):
+    return get_hyphenation_resolver().resolve_page(text, LINE_END_HYPHEN)
+
+def _layout_page(page_index, blocks, repeated):
+    """Rebuild the text of a page without repeated blocks, resolving line-end hyphens, and clean it"""
+    text = '\n'.join(_join_line_hyphens(block[4].strip('\n'))
+                     for block in blocks if _block_signature(block) not in repeated)
+    return PageText(page_index + 1, text, clean_text(text))
+
+def _extract_layout_pages(pdf_path, page_indices, total_pages, workers=None):
+    """
+    Layout aware extraction of page_indices. Blocks of every page of the document are read
+    to tell repeated headers / footers apart, so a page is rebuilt the same way whatever
+    range it is extracted in ; only page_indices are rebuilt and cleaned.
+    """
+    if not page_indices:
+        return
+    document_indices = range(total_pages)
+    if not workers or workers <= 1:
+        with fitz.open(pdf_path) as doc:
+            document_blocks = [_page_blocks(doc, page_index) for page_index in document_indices]
+        repeated = find_repeated_blocks(document_blocks)
+        for page_index in page_indices:
+            yield _layout_page(page_index, document_blocks[page_index], repeated)
+        return
+
+    with _page_pool(pdf_path, workers) as executor:
+        chunksize = max(1, total_pages // (4 * workers))
+        document_blocks = list(executor.map(_extract_worker_blocks, document_indices, chunksize=chunksize))
+        repeated = find_repeated_blocks(document_blocks)
+        yield from executor.map(_layout_page, page_indices, [document_blocks[i] for i in page_indices],
+                                repeat(repeated), chunksize=max(1, len(page_indices) // (4 * workers)))
+
+def _resolve_page_range(total_pages, from_page, to_page):
+    """Clamp a 1-based page range to the document and return 0-based (from_index, to_index)"""
+    # Handle default page range
+    if from_page is None:
+        from_page = 1
+    if to_page is None:
+        to_page = total_pages
+
+    # Validate page range
+    from_page = max(1, min(from_page, total_pages))  # Ensure from_page is between 1 and total_pages
+    to_page = max(from_page, min(to_page, total_pages))  # Ensure to_page is between from_page and total_pages
+
+    # Convert 1-based page numbers to 0-based indices
+    return from_page - 1, to_page - 1
+
+def _page_count(pdf_path):
+    with fitz.open(pdf_path) as doc:
+        return len(doc)
+
+def _extract_pages(pdf_path, page_indices, workers=None):
+    """Extract and clean the given pages in order, serially or in a process pool"""
+    if not page_indices:
+        return
+    if not workers or workers <= 1:
+        with fitz.open(pdf_path) as doc:
+            for page_index in page_indices:
+                yield _extract_page(doc, page_index)
+        return
+
+    with _page_pool(pdf_path, workers) as executor:
+        chunksize = max(1, len(page_indices) // (4 * workers))
+        yield from executor.map(_extract_worker_page, page_indices, chunksize=chunksize)
+
+def iter_pdf_pages(pdf_path, from_page=None, to_page=None, workers=None, cache=None, layout=False):
+    """
+    Stream extracted pages of a PDF as PageText(page_number, raw_text, cleaned_text) records,
+    in page order. The cleaned text can be fed straight to chunking without writing
+    intermediate page files.
+
+    Args:
+        pdf_path (str): Path to PDF file
+        from_page (int): Starting page number (1-based index). If None, starts from first page
+        to_page (int): Ending page number (1-based index). If None, processes until last page
+        workers (int): Extract and clean pages in this many processes, each opening its own
+                       fitz document. None or 1 extracts in the current process
+        cache (PageCache): Serve pages of an unchanged PDF from this cache and store newly
+                           extracted ones (optional)
+        layout (bool): Extract text blocks, drop blocks repeated at the same position across the
+                       document (running headers / footers) and join words hyphenated across
+                       lines before cleaning
+    """
+    pdf_hash = file_hash(pdf_path) if cache is not None else None
+    total_pages = cache.page_count(pdf_hash) if cache is not None else None
+    if total_pages is None:
+        total_pages = _page_count(pdf_path)
+        if cache is not None:
+            cache.set_page_count(pdf_hash, total_pages)
+
+    from_index, to_index = _resolve_page_range(total_pages, from_page, to_page)
+    page_indices = list(range(from_index, to_index + 1))
+
+    # layout mode produces different raw text, cache its pages separately
+    cleaner_version = f"{CLEANER_VERSION}-layout{LAYOUT_VERSION}" if layout else CLEANER_VERSION
+    cached = cache.get_pages(pdf_hash, cleaner_version, page_indices) if cache is not None else {}
+    # only new or changed pages are extracted
+    missing = [i for i in page_indices if i not in cached]
+    if layout:
+        extracted = _extract_layout_pages(pdf_path, missing, total_pages, workers)
+    else:
+        extracted = _extract_pages(pdf_path, missing, workers)
+    for page_index in page_indices:
+        if page_index in cached:
+            yield PageText(page_index + 1, *cached[page_index])
+            continue
+        page = next(extracted)
+        if cache is not None:
+            cache.put_page(pdf_hash, page_index, cleaner_version, page.raw_text, page.cleaned_text)
+        yield page
+
+def extract_text_from_pdf(pdf_path, from_page=None, to_page=None, output_dir=None, workers=None, cache=None,
+                          layout=False):
     """
     Extract text from PDF file page by page with page range support
-    
+
     Args:
         pdf_path (str): Path to PDF file
         from_page (int): Starting page number (1-based index). If None, starts from first page
         to_page (int): Ending page number (1-based index). If None, processes until last page
         output_dir (str): Directory to save extracted text files (optional)
+        workers (int): Number of processes to extract pages with (optional)
+        cache (PageCache): Cache of extracted pages, reruns only extract new or changed pages (optional)
+        layout (bool): Use layout aware extraction, dropping repeated headers / footers (optional)
     """
     try:
-        # Open PDF file
-        doc = fitz.open(pdf_path)
-        total_pages = len(doc)
-        
-        # Handle default page range
-        if from_page is None:
-            from_page = 1
-        if to_page is None:
-            to_page = total_pages
-            
-        # Validate page range
-        from_page = max(1, min(from_page, total_pages))  # Ensure from_page is between 1 and total_pages
-        to_page = max(from_page, min(to_page, total_pages))  # Ensure to_page is between from_page and total_pages
-        
-        # Convert 1-based page numbers to 0-based indices
-        from_index = from_page - 1
-        to_index = to_page - 1
-        
         # Create output directory if specified
         if output_dir:
             os.makedirs(output_dir, exist_ok=True)
-        
+
         # Process specified pages
-        for page_num in range(from_index, to_index + 1):
-            # Get the page
-            page = doc[page_num]
-            
-            # Get page text
-            text = page.get_text("text")  # Use 'text' mode for better formatting
-            
-            # clean the text
-            cleaned_text = clean_text(text)
+        pages = []
+        for page in iter_pdf_pages(pdf_path, from_page, to_page, workers=workers, cache=cache, layout=layout):
+            pages.append(page.page_number)
             # If output directory is specified, save to file
             if output_dir:
-                output_file = os.path.join(output_dir, f"page_{page_num + 1}.txt")
+                output_file = os.path.join(output_dir, f"page_{page.page_number}.txt")
                 with open(output_file, "w", encoding="utf-8") as f:
-                    f.write(cleaned_text)
-                print(f"Extracted and cleaned text from page {page_num + 1} saved to {output_file}")
+                    f.write(page.cleaned_text)
+                print(f"Extracted and cleaned text from page {page.page_number} saved to {output_file}")
             else:
-                print(f"\nPage {page_num + 1}:")
+                print(f"\nPage {page.page_number}:")
                 print("=" * 40)
-                print(cleaned_text)
+                print(page.cleaned_text)
                 print("=" * 40)
-        
+
         # Print summary
-        print(f"\nProcessed pages {from_page} to {to_page} out of {total_pages} total pages")
-        
-        # Close the PDF
-        doc.close()
-        
+        if pages:
+            print(f"\nProcessed pages {pages[0]} to {pages[-1]} ({len(pages)} pages)")
+
     except Exception as e:
         print(f"Error processing PDF: {str(e)}")
 
@@ -71,7 +224,8 @@ if __name__ == "__main__":
 
     pdf_path = "india-today.pdf"  # Replace with your PDF path
     output_dir = "extracted_text"  # Optional: specify output directory
-    
+
     # extract and clean text from PDF and generate instructions
-    extract_text_from_pdf(pdf_path,  output_dir=output_dir)
-    
+    page_cache = PageCache()
+    extract_text_from_pdf(pdf_path,  output_dir=output_dir, workers=os.cpu_count(), cache=page_cache)
+    page_cache.close()
@@ -0,0 +1,58 @@
+import argparse
+import hashlib
+import os
+from typing import Dict, Optional
+from response_cache import ResponseCache
+
+EVALUATION_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'evaluations.sqlite3')
+
+
+def pair_hash(instruction: str, response: str) -> str:
+    return hashlib.sha256(f"{instruction}\0{response}".encode('utf-8')).hexdigest()
+
+
+class EvaluationCache(ResponseCache):
+    """
+    On-disk cache of judge evaluations keyed by (model, temperature, criteria weights,
+    prompt version, hash of instruction + response). Changing the weights or bumping the
+    judge's PROMPT_VERSION misses the cache instead of serving stale scores.
+    """
+
+    def __init__(self, path: str = EVALUATION_CACHE_PATH, max_bytes: int = 256 * 1024 * 1024):
+        super().__init__(path, max_bytes)
+
+    @staticmethod
+    def _params(model: str, temperature: float, criteria: Dict[str, float], prompt_version: str,
+                instruction: str, response: str) -> Dict:
+        return {'model': model, 'temperature': temperature, 'criteria': criteria, 'prompt_version': prompt_version,
+                'pair': pair_hash(instruction, response)}
+
+    def get_evaluation(self, model: str, temperature: float, criteria: Dict[str, float], prompt_version: str,
+                       instruction: str, response: str) -> Optional[str]:
+        """Cached evaluation (EvaluationResult JSON) of a pair, None on a miss"""
+        return self.get(self._params(model, temperature, criteria, prompt_version, instruction, response))
+
+    def put_evaluation(self, model: str, temperature: float, criteria: Dict[str, float], prompt_version: str,
+                       instruction: str, response: str, evaluation: str):
+        self.put(self._params(model, temperature, criteria, prompt_version, instruction, response), 0, evaluation)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the judge evaluation cache")
+    parser.add_argument('command', choices=['stats', 'invalidate'])
+    parser.add_argument('--model', help="only invalidate the evaluations of this judge model")
+    parser.add_argument('--path', default=EVALUATION_CACHE_PATH, help="cache file")
+    args = parser.parse_args()
+
+    cache = EvaluationCache(args.path)
+    if args.command == 'invalidate':
+        dropped = cache.invalidate(args.model)
+        print(f"Dropped {dropped} cached evaluations" + (f" of {args.model}" if args.model else ""))
+    else:
+        stats = cache.stats()
+        print(f"{stats['entries']} cached evaluations, {stats['bytes']} bytes")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
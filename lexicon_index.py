@@ -0,0 +1,123 @@
+import os
+import pickle
+import logging
+import tempfile
+
+# Bump when the layout of the pickled index changes so stale caches are rebuilt
+LEXICON_FORMAT_VERSION = 1
+LEXICON_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'lexicon_index.pickle')
+
+_lexicon = None
+
+
+class LexiconIndex:
+    """
+    Precomputed lookup tables for the NLTK word list and WordNet.
+
+    - words         : the NLTK `words` corpus (case preserved, as `set(words.words())`)
+    - wordnet_forms : every lower-case form for which `wordnet.synsets(form)` is non-empty,
+                      i.e. lemma names plus the inflections WordNet's morphy can reduce
+    - verb_lemmas   : inflected form -> `WordNetLemmatizer().lemmatize(form, 'v')`,
+                      only for forms whose verb lemma differs from the form itself
+    """
+
+    def __init__(self, words, wordnet_forms, verb_lemmas):
+        self.words = words
+        self.wordnet_forms = wordnet_forms
+        self.verb_lemmas = verb_lemmas
+
+    def in_words(self, word):
+        """Check if a word is part of the NLTK word list"""
+        return word in self.words
+
+    def in_wordnet(self, word):
+        """Equivalent of bool(wordnet.synsets(word))"""
+        return word.lower() in self.wordnet_forms
+
+    def verb_lemma(self, word):
+        """Equivalent of WordNetLemmatizer().lemmatize(word, 'v')"""
+        return self.verb_lemmas.get(word, word)
+
+
+def _candidate_forms(wn):
+    """
+    Invert WordNet's morphological substitutions so that every string morphy could
+    reduce to a lemma is generated once : lemma names, exception list entries and
+    lemma + detachment suffix for each part of speech.
+    """
+    candidates = set()
+    for pos, substitutions in wn.MORPHOLOGICAL_SUBSTITUTIONS.items():
+        lemmas = list(wn.all_lemma_names(pos)) if pos != 's' else []
+        candidates.update(lemmas)
+        candidates.update(wn._exception_map[pos].keys())
+        for lemma in lemmas:
+            for old, new in substitutions:
+                if lemma.endswith(new):
+                    candidates.add(lemma[:len(lemma) - len(new)] + old)
+    return candidates
+
+
+def build_lexicon():
+    """Build the lexicon index from the NLTK corpora (slow, done once and persisted)"""
+    from nltk.corpus import wordnet, words
+    from nltk.corpus.reader.wordnet import POS_LIST
+
+    logging.info("building lexicon index from NLTK corpora")
+
+    word_set = set(words.words())
+    wordnet_forms = set()
+    verb_lemmas = {}
+    for form in _candidate_forms(wordnet):
+        # verify every candidate with WordNet itself so lookups stay exact
+        if any(wordnet._morphy(form, pos) for pos in POS_LIST):
+            wordnet_forms.add(form)
+        verb_forms = wordnet._morphy(form, wordnet.VERB)
+        if verb_forms:
+            base = min(verb_forms, key=len)
+            if base != form:
+                verb_lemmas[form] = base
+
+    logging.info(f"lexicon index : {len(word_set)} words, {len(wordnet_forms)} wordnet forms, "
+                 f"{len(verb_lemmas)} verb inflections")
+    return LexiconIndex(word_set, frozenset(wordnet_forms), verb_lemmas)
+
+
+def save_lexicon(lexicon, path=LEXICON_CACHE_PATH):
+    """Persist the lexicon index, writing to a temporary file unique to this writer first"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump({'version': LEXICON_FORMAT_VERSION,
+                         'words': lexicon.words,
+                         'wordnet_forms': lexicon.wordnet_forms,
+                         'verb_lemmas': lexicon.verb_lemmas}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_lexicon(path=LEXICON_CACHE_PATH):
+    """Load a persisted lexicon index, returns None if missing or from an older format"""
+    try:
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return None
+    if data.get('version') != LEXICON_FORMAT_VERSION:
+        return None
+    return LexiconIndex(data['words'], data['wordnet_forms'], data['verb_lemmas'])
+
+
+def get_lexicon(path=LEXICON_CACHE_PATH):
+    """Return the process wide lexicon index, loading or building it on first use"""
+    global _lexicon
+    if _lexicon is None:
+        lexicon = load_lexicon(path)
+        if lexicon is None:
+            lexicon = build_lexicon()
+            save_lexicon(lexicon, path)
+        _lexicon = lexicon
+    return _lexicon
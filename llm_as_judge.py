@@ -1,12 +1,45 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Iterator, Tuple
 import json
+import os
+import random
+import time
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+import openai
 from openai import OpenAI
 from pydantic import BaseModel
+from rate_limit import retry_after_seconds
+from evaluation_cache import EvaluationCache
+from prescreen import instruction_key, screen_pairs
+
+# Bump when the system prompt, rubric or schemas change so cached evaluations are not reused
+PROMPT_VERSION = "1"
+
+JUDGE_TEMPERATURE = 0.3
+
+# Rubric shared by the single pair and packed evaluation prompts
+EVALUATION_CRITERIA = """Evaluate based on these criteria and provide scores (0-1) with detailed reasoning:
+
+1. Task Adherence:
+   - Does it fully address the instruction?
+   - Are all requirements met?
+   - Is the format correct?
+
+2. Helpfulness:
+   - Is it clear and well-explained?
+   - Is the information accurate and useful?
+   - Is it appropriate for the audience?
+
+3. Safety:
+   - Does it avoid harmful content?
+   - Are appropriate disclaimers included?
+   - Does it respect ethical boundaries?"""
 
 
 class InstructionPair(BaseModel):
     instruction: str
     response: str
+    source: Optional[str] = None  # chunk text the pair was generated from, checked by the pre-screen
 
 
 class EvaluationResult(BaseModel):
@@ -16,17 +49,125 @@ class EvaluationResult(BaseModel):
     weighted_score: float
 
 
+class EvaluationFailure(BaseModel):
+    index: int
+    instruction: str
+    error: str
+    attempts: int
+
+
+class PrescreenRejection(BaseModel):
+    index: int
+    instruction: str
+    reason: str
+
+
+class BatchEvaluation(BaseModel):
+    results: List[Optional[EvaluationResult]]  # in input order, None where the evaluation failed or was rejected
+    failures: List[EvaluationFailure]
+    rejections: List[PrescreenRejection] = []
+
+    @property
+    def succeeded(self) -> int:
+        return len(self.results) - len(self.failures) - len(self.rejections)
+
+
+def iter_message_pairs(file_path: str, start_offset: int = 0) -> Iterator[Tuple[int, int, InstructionPair]]:
+    """
+    Stream (offset, end, pair) from a role / content JSONL file as written by process_text.
+
+    offset is the byte offset of the pair's user line and end the offset right after its
+    assistant line, so a run can resume from the end of the last pair it scored. An assistant
+    message without a preceding user message, or a user message followed by another one,
+    is skipped. A "source" field of the user message (the chunk the pair was generated from)
+    becomes the pair's source.
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(start_offset)
+        offset = start_offset
+        user = None
+        for line in f:
+            line_offset = offset
+            offset += len(line)
+            if not line.strip():
+                continue
+            message = json.loads(line)
+            if message['role'] == 'user':
+                user = (line_offset, message)
+            elif user is not None:
+                yield user[0], offset, InstructionPair(instruction=user[1]['content'], response=message['content'],
+                                                       source=user[1].get('source'))
+                user = None
+
+
+def _last_row(output_file: str) -> Optional[Dict[str, Any]]:
+    """
+    Last row of an evaluation output file, None if there is none.
+    A row a crashed run left half written is cut off.
+    """
+    if not os.path.exists(output_file):
+        return None
+    with open(output_file, 'r+b') as f:
+        size = f.seek(0, os.SEEK_END)
+        # read backwards until the last complete row is in the tail
+        tail_size = 4096
+        while True:
+            start = max(0, size - tail_size)
+            f.seek(start)
+            tail = f.read()
+            complete = tail[:tail.rfind(b'\n') + 1]
+            rows = complete.splitlines()
+            if len(rows) >= 2 or start == 0:
+                break
+            tail_size *= 2
+        if len(complete) < len(tail):
+            f.truncate(start + len(complete))
+    return json.loads(rows[-1]) if rows else None
+
+
+def _screened_instructions(output_file: str) -> set:
+    """Duplicate keys of the instructions an earlier pre-screened run forwarded to the judge"""
+    with open(output_file, 'r', encoding='utf-8') as f:
+        return {instruction_key(row['instruction']) for row in map(json.loads, f) if 'rejected' not in row}
+
+
+def _check_resume_row(input_file: str, output_file: str, row: Dict[str, Any]):
+    """Raise ValueError unless the row's offset is the start of the line holding its instruction in input_file"""
+    with open(input_file, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        offset = row['offset']
+        valid = 0 <= offset < row['end'] <= size
+        if valid and offset > 0:
+            f.seek(offset - 1)
+            valid = f.read(1) == b'\n'
+        if valid:
+            f.seek(offset)
+            try:
+                message = json.loads(f.readline())
+                valid = message.get('role') == 'user' and message.get('content') == row['instruction']
+            except (json.JSONDecodeError, UnicodeDecodeError, AttributeError):
+                valid = False
+    if not valid:
+        raise ValueError(f"{output_file} was not written for {input_file} (its last row does not match the "
+                         f"input at byte {row['offset']}), remove it or pass resume=False")
+
+
 class LLMJudge:
-    def __init__(self, api_key: str, model: str = "gpt-4o-2024-11-20"):
+    def __init__(self, api_key: str, model: str = "gpt-4o-2024-11-20", base_url: str = None,
+                 cache: EvaluationCache = None):
         """
         Initialize the LLM judge.
 
         Args:
             api_key: OpenAI API key
             model: Model to use for evaluation (default: gpt-4)
+            base_url: OpenAI compatible endpoint (default: OpenAI's, e.g. a local mock server in tests)
+            cache: Evaluation cache consulted before calling the API (default: none)
         """
-        self.client = OpenAI(api_key=api_key)
+        # SDK retries are off, evaluate_pairs retries failed requests itself
+        self.client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
         self.model = model
+        self.cache = cache
 
         # Default evaluation criteria with weights
         self.criteria = {
@@ -39,6 +180,10 @@ class LLMJudge:
         """
         Evaluate a single instruction-response pair using the LLM.
         """
+        cached = self._cached_result(instruction, response)
+        if cached is not None:
+            return cached
+
         evaluation_prompt = self._create_evaluation_prompt(
             instruction, response)
 
@@ -106,34 +251,324 @@ class LLMJudge:
                         }
                     }
                 },
-                temperature=0.3  # Lower temperature for more consistent evaluations
+                temperature=JUDGE_TEMPERATURE  # Lower temperature for more consistent evaluations
             )
 
-            result = json.loads(completion.choices[0].message.content)
+            result = self._to_result(json.loads(completion.choices[0].message.content))
+            self._store_result(instruction, response, result)
+            return result
 
-            # Calculate weighted score
-            weighted_score = sum(
-                result[criterion]["score"] * weight
-                for criterion, weight in self.criteria.items()
-            )
+        except Exception as e:
+            raise Exception(f"Error during evaluation: {str(e)}") from e
+
+    def _cached_result(self, instruction: str, response: str) -> Optional[EvaluationResult]:
+        if self.cache is None:
+            return None
+        cached = self.cache.get_evaluation(self.model, JUDGE_TEMPERATURE, self.criteria, PROMPT_VERSION,
+                                           instruction, response)
+        return EvaluationResult.model_validate_json(cached) if cached is not None else None
+
+    def _store_result(self, instruction: str, response: str, result: EvaluationResult):
+        if self.cache is not None:
+            self.cache.put_evaluation(self.model, JUDGE_TEMPERATURE, self.criteria, PROMPT_VERSION,
+                                      instruction, response, result.model_dump_json())
+
+    def _to_result(self, result: Dict[str, Any]) -> EvaluationResult:
+        """Validate the scores of one pair and compute its weighted score, raises ValueError when invalid"""
+        for criterion in self.criteria:
+            value = result.get(criterion)
+            if not isinstance(value, dict):
+                raise ValueError(f"missing {criterion} evaluation")
+            score = value.get("score")
+            if isinstance(score, bool) or not isinstance(score, (int, float)) or not 0 <= score <= 1:
+                raise ValueError(f"invalid {criterion} score {score!r}")
+            if not isinstance(value.get("reasoning"), str):
+                raise ValueError(f"missing {criterion} reasoning")
+        if not isinstance(result.get("overall_feedback"), str):
+            raise ValueError("missing overall_feedback")
+
+        # Calculate weighted score
+        weighted_score = sum(
+            result[criterion]["score"] * weight
+            for criterion, weight in self.criteria.items()
+        )
+
+        return EvaluationResult(
+            scores={k: v["score"]
+                    for k, v in result.items() if k in self.criteria},
+            reasoning={k: v["reasoning"]
+                       for k, v in result.items() if k in self.criteria},
+            overall_feedback=result["overall_feedback"],
+            weighted_score=round(weighted_score, 3)
+        )
+
+    def _packed_schema(self) -> Dict[str, Any]:
+        """Response schema of a packed evaluation : one evaluation object per pair"""
+        criterion = {
+            "type": "object",
+            "properties": {
+                "score": {"type": "number", "description": "between 0 to 1"},
+                "reasoning": {"type": "string", "description": "detailed explanation"}
+            },
+            "required": ["score", "reasoning"],
+            "additionalProperties": False
+        }
+        evaluation = {
+            "type": "object",
+            "properties": {
+                "pair": {"type": "integer", "description": "number of the evaluated pair"},
+                **{name: criterion for name in self.criteria},
+                "overall_feedback": {"type": "string", "description": "summary and suggestions for improvement"}
+            },
+            "required": ["pair", *self.criteria, "overall_feedback"],
+            "additionalProperties": False
+        }
+        return {
+            "type": "object",
+            "properties": {"evaluations": {"type": "array", "items": evaluation}},
+            "required": ["evaluations"],
+            "additionalProperties": False
+        }
 
-            return EvaluationResult(
-                scores={k: v["score"]
-                        for k, v in result.items() if k in self.criteria},
-                reasoning={k: v["reasoning"]
-                           for k, v in result.items() if k in self.criteria},
-                overall_feedback=result["overall_feedback"],
-                weighted_score=round(weighted_score, 3)
-            )
+    def evaluate_packed(self, pairs: List[InstructionPair]) -> List[Optional[EvaluationResult]]:
+        """
+        Evaluate several pairs in one request, sending the system prompt, rubric and schema once.
 
-        except Exception as e:
-            raise Exception(f"Error during evaluation: {str(e)}")
+        Returns one result per pair in input order, None for pairs whose evaluation is missing
+        from the response or fails validation. Raises ValueError when the response cannot be
+        parsed and the API error when the request itself fails. Cached pairs are not sent, no
+        request is made when all of them are cached.
+        """
+        results = [self._cached_result(pair.instruction, pair.response) for pair in pairs]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": self._get_system_prompt()},
+                {"role": "user", "content": self._create_packed_prompt([pairs[i] for i in missing])}
+            ],
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "packed_evaluation_scores", "schema": self._packed_schema()}
+            },
+            temperature=JUDGE_TEMPERATURE  # Lower temperature for more consistent evaluations
+        )
+        try:
+            evaluations = json.loads(completion.choices[0].message.content)["evaluations"]
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            raise ValueError(f"Unparseable packed evaluation: {e!r}") from e
+        if not isinstance(evaluations, list):
+            raise ValueError("Unparseable packed evaluation: evaluations is not a list")
+
+        for evaluation in evaluations:
+            number = evaluation.get("pair") if isinstance(evaluation, dict) else None
+            if not isinstance(number, int) or not 1 <= number <= len(missing):
+                continue
+            index = missing[number - 1]
+            if results[index] is not None:
+                continue
+            try:
+                results[index] = self._to_result(evaluation)
+            except ValueError as e:
+                print(f"Invalid evaluation of packed pair {number}: {e}")
+                continue
+            self._store_result(pairs[index].instruction, pairs[index].response, results[index])
+        return results
+
+    @staticmethod
+    def _retry_delay(error: Exception, attempt: int, backoff: float) -> float:
+        """Seconds to wait before retrying a failed request, the server's retry-after when rate limited"""
+        rate_limit = error if isinstance(error, openai.RateLimitError) else error.__cause__
+        if isinstance(rate_limit, openai.RateLimitError):
+            return retry_after_seconds(rate_limit.response.headers, default=backoff * 2 ** attempt)
+        # exponential backoff with jitter so failed workers do not retry in lockstep
+        return backoff * 2 ** (attempt - 1) * (1 + random.random())
+
+    def _evaluate_with_retry(self, index: int, pair: InstructionPair, max_attempts: int, backoff: float):
+        """(result, None) or, once every attempt failed, (None, EvaluationFailure)"""
+        for attempt in range(1, max_attempts + 1):
+            try:
+                return self.evaluate(pair.instruction, pair.response), None
+            except Exception as e:
+                if attempt == max_attempts:
+                    return None, EvaluationFailure(index=index, instruction=pair.instruction, error=str(e),
+                                                   attempts=attempt)
+                time.sleep(self._retry_delay(e, attempt, backoff))
+
+    def _evaluate_group(self, start: int, group: List[InstructionPair], max_attempts: int, backoff: float):
+        """
+        Packed evaluation of a group. A failed request (rate limit, timeout, server error) is
+        retried as a pack, only pairs missing or invalid in a parsed response, or every pair of
+        an unparseable one, are evaluated one by one.
+        """
+        for attempt in range(1, max_attempts + 1):
+            try:
+                results = self.evaluate_packed(group)
+                break
+            except ValueError as e:
+                print(f"Packed evaluation of pairs {start + 1}-{start + len(group)} failed: {e}")
+                results = [None] * len(group)
+                break
+            except Exception as e:
+                if attempt == max_attempts:
+                    return [(None, EvaluationFailure(index=start + offset, instruction=pair.instruction,
+                                                     error=str(e), attempts=attempt))
+                            for offset, pair in enumerate(group)]
+                time.sleep(self._retry_delay(e, attempt, backoff))
+        return [(result, None) if result is not None
+                else self._evaluate_with_retry(start + offset, pair, max_attempts, backoff)
+                for offset, (pair, result) in enumerate(zip(group, results))]
+
+    def evaluate_batch(self, pairs: List[InstructionPair], concurrency: int = 8, max_attempts: int = 3,
+                       backoff: float = 1.0, pack_size: int = 1) -> List[EvaluationResult]:
+        """
+        Evaluate multiple instruction-response pairs, concurrently (see evaluate_pairs).
+
+        Raises RuntimeError if a pair still fails after max_attempts, use evaluate_pairs to keep
+        the results of the other pairs.
+        """
+        batch = self.evaluate_pairs(pairs, concurrency=concurrency, max_attempts=max_attempts, backoff=backoff,
+                                    pack_size=pack_size)
+        if batch.failures:
+            failure = batch.failures[0]
+            raise RuntimeError(f"{len(batch.failures)} of {len(pairs)} evaluations failed, pair {failure.index} "
+                               f"after {failure.attempts} attempts: {failure.error}")
+        return batch.results
+
+    def evaluate_pairs(self, pairs: List[InstructionPair], concurrency: int = 8, max_attempts: int = 3,
+                       backoff: float = 1.0, pack_size: int = 1, prescreen: bool = False,
+                       seen: set = None) -> BatchEvaluation:
+        """
+        Evaluate multiple instruction-response pairs concurrently, reporting failures instead of raising.
 
-    def evaluate_batch(self, pairs: List[InstructionPair]) -> List[EvaluationResult]:
+        Args:
+            pairs: Pairs to evaluate
+            concurrency: Number of evaluations in flight
+            max_attempts: Attempts per pair before it is reported as failed
+            backoff: Delay before the first retry in seconds, doubled at each attempt
+                     (a rate limited request waits for the server's retry-after instead)
+            pack_size: Score up to this many pairs per request (see evaluate_packed), pairs
+                       missing or invalid in a packed response fall back to single pair calls
+            prescreen: Reject obvious failures (empty, short, repetitive, ungrounded or duplicated
+                       pairs, see prescreen.py) locally and only send the other pairs to the judge
+            seen: Normalized instructions already screened, for duplicates across batches
+
+        Returns:
+            BatchEvaluation: results in input order (None for failed and rejected pairs), the
+                             failures and the rejections, one failing pair does not stop the others
+        """
+        if not prescreen:
+            return self._judge_batch(pairs, concurrency, max_attempts, backoff, pack_size)
+
+        reasons = screen_pairs(pairs, seen)
+        forwarded = [i for i, reason in enumerate(reasons) if reason is None]
+        rejections = [PrescreenRejection(index=i, instruction=pair.instruction, reason=reason)
+                      for i, (pair, reason) in enumerate(zip(pairs, reasons)) if reason is not None]
+        if rejections:
+            print(f"Pre-screen rejected {len(rejections)} of {len(pairs)} pairs")
+        judged = self._judge_batch([pairs[i] for i in forwarded], concurrency, max_attempts, backoff, pack_size)
+
+        results = [None] * len(pairs)
+        for i, result in zip(forwarded, judged.results):
+            results[i] = result
+        failures = [failure.model_copy(update={'index': forwarded[failure.index]}) for failure in judged.failures]
+        return BatchEvaluation(results=results, failures=failures, rejections=rejections)
+
+    def _judge_batch(self, pairs: List[InstructionPair], concurrency: int, max_attempts: int, backoff: float,
+                     pack_size: int) -> BatchEvaluation:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            if pack_size > 1:
+                starts = range(0, len(pairs), pack_size)
+                groups = executor.map(lambda start: self._evaluate_group(start, pairs[start:start + pack_size],
+                                                                         max_attempts, backoff), starts)
+                outcomes = [outcome for group in groups for outcome in group]
+            else:
+                outcomes = list(executor.map(lambda item: self._evaluate_with_retry(*item, max_attempts, backoff),
+                                             enumerate(pairs)))
+        failures = [failure for _, failure in outcomes if failure is not None]
+        if failures:
+            print(f"{len(failures)} of {len(pairs)} evaluations failed")
+        return BatchEvaluation(results=[result for result, _ in outcomes], failures=failures)
+
+    def evaluate_file(self, input_file: str, output_file: str, concurrency: int = 8, window: int = None,
+                      max_attempts: int = 3, backoff: float = 1.0, pack_size: int = 1,
+                      resume: bool = True, prescreen: bool = False) -> Dict[str, Any]:
         """
-        Evaluate multiple instruction-response pairs.
+        Judge a role / content JSONL dataset, streaming it in windows of pairs.
+
+        Each window is evaluated with evaluate_pairs and its rows are appended to output_file in
+        input order as soon as the window is done, so memory use does not grow with the dataset.
+        A row holds the pair's byte offset and end in the input file, the instruction and either
+        the evaluation, the error or the pre-screen rejection. With resume, scoring starts right
+        after the last pair of an existing output file.
+
+        Args:
+            input_file: Dataset of alternating user / assistant messages
+            output_file: JSONL file evaluation rows are appended to
+            concurrency, max_attempts, backoff, pack_size: see evaluate_pairs
+            window: Pairs read and evaluated at a time (default: 4 per worker and pack)
+            resume: Skip the pairs already in output_file, raises ValueError if that file was
+                    written for another input
+            prescreen: Reject obvious failures locally, see evaluate_pairs. Duplicates are
+                       detected across the whole run, resumed runs included. Pairs are checked
+                       against the chunk in the "source" field of their user line, which
+                       ContextualInstructionGenerator writes, pairs without one are not
+
+        Returns:
+            dict: pairs, failed, rejected, resumed_from (input offset), seconds and mean_weighted_score of the run,
+            plus the run's cache hits and misses when the judge has a cache
         """
-        return [self.evaluate(pair.instruction, pair.response) for pair in pairs]
+        start = time.perf_counter()
+        window = window or 4 * concurrency * pack_size
+        last_row = _last_row(output_file) if resume else None
+        if last_row is not None:
+            _check_resume_row(input_file, output_file, last_row)
+        start_offset = last_row['end'] if last_row is not None else 0
+        if start_offset:
+            print(f"Resuming {input_file} from byte {start_offset}")
+
+        stats = {'pairs': 0, 'failed': 0, 'rejected': 0, 'resumed_from': start_offset}
+        seen = _screened_instructions(output_file) if prescreen and start_offset else set()
+        cache_start = self.cache.stats() if self.cache is not None else None
+        score_sum = 0.0
+        records = iter_message_pairs(input_file, start_offset)
+        with open(output_file, 'a' if resume else 'w', encoding='utf-8') as out:
+            while True:
+                chunk = list(islice(records, window))
+                if not chunk:
+                    break
+                batch = self.evaluate_pairs([pair for _, _, pair in chunk], concurrency=concurrency,
+                                            max_attempts=max_attempts, backoff=backoff, pack_size=pack_size,
+                                            prescreen=prescreen, seen=seen)
+                errors = {failure.index: failure.error for failure in batch.failures}
+                rejected = {rejection.index: rejection.reason for rejection in batch.rejections}
+                for i, ((offset, end, pair), result) in enumerate(zip(chunk, batch.results)):
+                    row = {'offset': offset, 'end': end, 'instruction': pair.instruction}
+                    if result is not None:
+                        row['evaluation'] = result.model_dump()
+                        score_sum += result.weighted_score
+                    elif i in rejected:
+                        row['rejected'] = rejected[i]
+                    else:
+                        row['error'] = errors[i]
+                    out.write(json.dumps(row, ensure_ascii=False) + '\n')
+                out.flush()
+                os.fsync(out.fileno())
+                stats['pairs'] += len(chunk)
+                stats['failed'] += len(errors)
+                stats['rejected'] += len(rejected)
+                print(f"Evaluated {stats['pairs']} pairs ({stats['failed']} failed, {stats['rejected']} rejected)")
+
+        evaluated = stats['pairs'] - stats['failed'] - stats['rejected']
+        stats['seconds'] = time.perf_counter() - start
+        stats['mean_weighted_score'] = round(score_sum / evaluated, 3) if evaluated else None
+        if self.cache is not None:
+            cache_stats = self.cache.stats()
+            stats['cache'] = {name: cache_stats[name] - cache_start[name] for name in ('hits', 'misses')}
+        return stats
 
     def _get_system_prompt(self) -> str:
         """
@@ -157,22 +592,7 @@ INSTRUCTION:
 RESPONSE:
 {response}
 
-Evaluate based on these criteria and provide scores (0-1) with detailed reasoning:
-
-1. Task Adherence:
-   - Does it fully address the instruction?
-   - Are all requirements met?
-   - Is the format correct?
-
-2. Helpfulness:
-   - Is it clear and well-explained?
-   - Is the information accurate and useful?
-   - Is it appropriate for the audience?
-
-3. Safety:
-   - Does it avoid harmful content?
-   - Are appropriate disclaimers included?
-   - Does it respect ethical boundaries?
+{EVALUATION_CRITERIA}
 
 Return your evaluation in this JSON format:
 {{
@@ -191,6 +611,35 @@ Return your evaluation in this JSON format:
     "overall_feedback": <summary and suggestions for improvement>
 }}"""
 
+    def _create_packed_prompt(self, pairs: List[InstructionPair]) -> str:
+        """
+        Create the evaluation prompt for several numbered instruction-response pairs.
+        """
+        numbered = "\n\n".join(f"""PAIR {number}
+INSTRUCTION:
+{pair.instruction}
+
+RESPONSE:
+{pair.response}""" for number, pair in enumerate(pairs, 1))
+        return f"""Evaluate each of these {len(pairs)} instruction-response pairs independently:
+
+{numbered}
+
+{EVALUATION_CRITERIA}
+
+Return one evaluation per pair, in pair order, in this JSON format:
+{{
+    "evaluations": [
+        {{
+            "pair": <pair number>,
+            "task_adherence": {{"score": <float between 0 and 1>, "reasoning": <detailed explanation>}},
+            "helpfulness": {{"score": <float between 0 and 1>, "reasoning": <detailed explanation>}},
+            "safety": {{"score": <float between 0 and 1>, "reasoning": <detailed explanation>}},
+            "overall_feedback": <summary and suggestions for improvement>
+        }}
+    ]
+}}"""
+
 
 def main():
     # Example usage
@@ -1,25 +1,37 @@
+import hashlib
 import json
 import time
-import os
-from typing import List, Dict
-import anthropic
+from typing import List, Dict, Tuple, Union
 from tenacity import retry, wait_exponential, stop_after_attempt
 from dotenv import load_dotenv
+from client_pool import ClientPool, load_api_keys
+from batch_job import BatchJob
+from response_cache import ResponseCache
+from pair_parser import parse_pairs, flatten_pairs
 
+# The prompt asks for 2-3 exchanges, shorter conversations are continued with a follow-up request
+MIN_EXCHANGES = 2
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
 
 
 class ConversationDatasetCreator:
-    def __init__(self, api_key: str):
-        self.client = anthropic.Client(api_key=api_key)
+    def __init__(self, api_key: Union[str, List[str], ClientPool], base_url: str = None,
+                 cache: ResponseCache = None, bypass_cache: bool = False):
+        # one key, several keys to round robin over, or a pool shared with another generator
+        self.pool = api_key if isinstance(api_key, ClientPool) else ClientPool(api_key, base_url=base_url)
+        # responses to prompts already sent are served from the cache unless bypassed
+        self.cache = cache
+        self.bypass_cache = bypass_cache
 
-    @retry(wait=wait_exponential(multiplier=1, min=4, max=60), stop=stop_after_attempt(3))
-    def generate_conversation(self, context: str) -> List[Dict]:
-        """Generate a natural conversation based on the given context."""
-        prompt = f"""Based on this context, create a natural conversation between a user and an assistant. The conversation should include questions and detailed responses about the topics in the context. Format it exactly as a list of dictionaries with 'role' and 'content' keys, alternating between 'user' and 'assistant' roles.
+    def _build_prompt(self, context: str) -> str:
+        return f"""Based on this context, create a natural conversation between a user and an assistant. The conversation should include questions and detailed responses about the topics in the context. Format it exactly as a list of dictionaries with 'role' and 'content' keys, alternating between 'user' and 'assistant' roles.
 
 Context: {context}
 
-Return the conversation in this exact format (a Python list of dicts):
+Return the conversation in this exact format (a JSON list, with double quotes for strings):
 [
     {{"role": "user", "content": "user's question"}},
     {{"role": "assistant", "content": "detailed response"}},
@@ -29,16 +41,65 @@ Return the conversation in this exact format (a Python list of dicts):
 
 Generate a conversation with 2-3 exchanges (4-6 messages total). Make the questions natural and the responses detailed and helpful."""
 
-        response = self.client.messages.create(
-            model="claude-3-sonnet-20240229",
-            max_tokens=2000,
-            temperature=0.7,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        
-        # Extract and parse the conversation
+    def _message_params(self, prompt: str) -> Dict:
+        return {'model': "claude-3-sonnet-20240229", 'max_tokens': 2000, 'extra_body': {'temperature': 0.7},
+                'messages': [{"role": "user", "content": prompt}]}
+
+    def _build_continuation_prompt(self, context: str, exchanges: List[Tuple[Dict, Dict]], missing: int) -> str:
+        conversation = json.dumps(flatten_pairs(exchanges), indent=4, ensure_ascii=False)
+        return f"""Based on this context, continue the conversation below between a user and an assistant with {missing} more exchanges. The new questions should follow up naturally on the conversation and the responses should be detailed and helpful.
+
+Context: {context}
+
+Conversation so far:
+{conversation}
+
+Return only the new messages in this exact format (a JSON list, with double quotes for strings):
+[
+    {{"role": "user", "content": "follow-up question"}},
+    {{"role": "assistant", "content": "detailed response"}}
+]"""
+
+    def _parse_exchanges(self, response_text: str) -> List[Tuple[Dict, Dict]]:
+        """Every complete (user, assistant) exchange of a response, a response without any is an error"""
+        exchanges = parse_pairs(response_text)
+        if not exchanges:
+            raise ValueError(f"No conversation in response: {response_text[:200]!r}")
+        return exchanges
+
+    def _request_exchanges(self, prompt: str, sample_index: int) -> List[Tuple[Dict, Dict]]:
+        params = self._message_params(prompt)
+        if self.cache is not None and not self.bypass_cache:
+            response_text = self.cache.get(params, sample_index)
+            if response_text is not None:
+                return self._parse_exchanges(response_text)
+
+        response = self.pool.create_message(**params)
+        time.sleep(1 / len(self.pool))  # Rate limiting, one request per second and per key
+
+        # Extract and parse the conversation, a response without any exchange is retried rather than cached
         response_text = response.content[0].text
-        return eval(response_text)  # Safe since we're controlling the input format
+        exchanges = self._parse_exchanges(response_text)
+        if self.cache is not None:
+            self.cache.put(params, sample_index, response_text)
+        return exchanges
+
+    @retry(wait=wait_exponential(multiplier=1, min=4, max=60), stop=stop_after_attempt(3))
+    def generate_conversation(self, context: str, sample_index: int = 0) -> List[Dict]:
+        """Generate a natural conversation based on the given context.
+
+        Complete exchanges are kept from a malformed or cut off response and a conversation of
+        fewer than MIN_EXCHANGES is continued rather than generated again. sample_index numbers
+        the conversations drawn for the same context, each is cached apart.
+        """
+        exchanges = self._request_exchanges(self._build_prompt(context), sample_index)
+        if len(exchanges) < MIN_EXCHANGES:
+            try:
+                exchanges += self._request_exchanges(
+                    self._build_continuation_prompt(context, exchanges, MIN_EXCHANGES - len(exchanges)), sample_index)
+            except Exception as e:
+                print(f"Keeping {len(exchanges)} exchanges, continuing the conversation failed: {e}")
+        return flatten_pairs(exchanges)
 
     def create_dataset(self, texts: List[str], conversations_per_text: int = 2) -> List[Dict]:
         """Create a complete conversation dataset from multiple texts."""
@@ -48,16 +109,73 @@ Generate a conversation with 2-3 exchanges (4-6 messages total). Make the questi
             print(f"\nGenerating conversations for text: {text[:100]}...")
             for i in range(conversations_per_text):
                 try:
-                    conversation = self.generate_conversation(text)
+                    conversation = self.generate_conversation(text, sample_index=i)
                     dataset.extend(conversation)
                     print(f"Generated conversation {i+1}/{conversations_per_text}")
-                    time.sleep(1)  # Rate limiting
                 except Exception as e:
                     print(f"Error generating conversation: {e}")
                     continue
         
         return dataset
 
+    def create_dataset_batch(self, texts: List[str], conversations_per_text: int = 2,
+                             state_file: str = None, poll_interval: float = 60,
+                             timeout: float = None) -> List[Dict]:
+        """Create the dataset of create_dataset with one Message Batches API submission.
+
+        The batch id is kept in state_file, by default a file named after a hash of the texts, so
+        an interrupted run over the same texts resumes polling the same batch instead of
+        submitting it again. Requests are named by text hash and sample index, a batch submitted
+        for other texts is never taken for this one. Conversations found in the cache are not
+        submitted. Conversations are returned in text order.
+        """
+        text_hashes = [_text_hash(text) for text in texts]
+        if state_file is None:
+            run_hash = _text_hash(json.dumps([text_hashes, conversations_per_text]))
+            state_file = f"conversation_batch_{run_hash[:16]}.json"
+        conversations = {}
+        requests = {}
+        positions = {}
+        for t, text in enumerate(texts):
+            params = self._message_params(self._build_prompt(text))
+            for i in range(conversations_per_text):
+                response_text = None
+                if self.cache is not None and not self.bypass_cache:
+                    response_text = self.cache.get(params, i)
+                if response_text is not None:
+                    conversations[(t, i)] = flatten_pairs(self._parse_exchanges(response_text))
+                    continue
+                # custom ids are limited to 64 characters, the same text repeated is requested once
+                custom_id = f"{text_hashes[t][:48]}-{i}"
+                requests.setdefault(custom_id, {'custom_id': custom_id, 'params': params})
+                positions.setdefault(custom_id, []).append((t, i))
+
+        job = BatchJob(self.pool, state_file, poll_interval)
+        if requests:
+            job.submit(list(requests.values()))
+            job.wait(timeout)
+            for custom_id, response_text, error in job.results():
+                if custom_id not in requests:
+                    # served from the cache since the batch was submitted
+                    continue
+                try:
+                    if error:
+                        raise RuntimeError(error)
+                    conversation = flatten_pairs(self._parse_exchanges(response_text))
+                    for t, i in positions[custom_id]:
+                        conversations[(t, i)] = conversation
+                    if self.cache is not None:
+                        self.cache.put(requests[custom_id]['params'], positions[custom_id][0][1], response_text)
+                except Exception as e:
+                    print(f"Error generating conversation {custom_id}: {e}")
+        print(f"Generated {len(conversations)}/{len(texts) * conversations_per_text} conversations")
+        job.clear()
+
+        dataset = []
+        for key in sorted(conversations):
+            dataset.extend(conversations[key])
+        return dataset
+
     def save_dataset(self, dataset: List[Dict], output_file: str, format: str = 'jsonl'):
         """Save the dataset to a file.
         
@@ -79,7 +197,7 @@ Generate a conversation with 2-3 exchanges (4-6 messages total). Make the questi
             print(f"Error saving dataset: {e}")
 def main():
     load_dotenv()
-    API_KEY =  os.getenv("ANTHROPIC_API_KEY")
+    API_KEYS = load_api_keys()
     
     # Sample texts (replace with your actual texts)
     texts = [
@@ -96,7 +214,7 @@ def main():
     ]
     
     try:
-        creator = ConversationDatasetCreator(API_KEY)
+        creator = ConversationDatasetCreator(API_KEYS)
         
         # Generate dataset
         dataset = creator.create_dataset(texts, conversations_per_text=2)
@@ -2,9 +2,12 @@ import nltk
 from nltk.corpus import names
 from nltk.tag import pos_tag
 import re
+from functools import lru_cache
+
+LETTERS_ONLY = re.compile(r'^[A-Za-z]+$')
 
 class NameChecker:
-    def __init__(self):
+    def __init__(self, cache_size=100000):
         # Download required NLTK data , commenting below , as actual download is interactive.
         #nltk.download('names')
         #nltk.download('averaged_perceptron_tagger')
@@ -21,6 +24,12 @@ class NameChecker:
             'pal', 'deep', 'preet', 'jeet', 'nath', 'ram', 'ji', 'dev',
             'esh', 'endra', 'ani', 'ati', 'mata', 'sha', 'pri', 'van'
         }
+        # All endings in one alternation anchored at the end of the word ; the leftmost
+        # match start wins, so the reported ending is the longest one that matches
+        self._ending_matcher = re.compile(
+            '(' + '|'.join(re.escape(e) for e in sorted(self.indian_endings, key=len, reverse=True)) + ')$')
+        # verdicts are cached per title cased word
+        self._verdict = lru_cache(maxsize=cache_size)(self._check_name)
 
     def is_likely_name(self, word):
         """
@@ -36,20 +45,21 @@ class NameChecker:
             return False, 0, "Empty input"
             
         # Basic validation
-        if not re.match(r'^[A-Za-z]+$', word):
+        if not LETTERS_ONLY.match(word):
             return False, 0, "Contains invalid characters"
             
-        word = word.title()  # Convert to title case for checking
-        
+        return self._verdict(word.title())  # Convert to title case for checking
+
+    def _check_name(self, word):
+        """Name checks for a title cased word made of letters only"""
         # Method 1: Check against NLTK name lists
         if word in self.male_names or word in self.female_names:
             return True, 1.0, "Found in NLTK names corpus"
             
         # Method 3: Check for Indian name patterns
-        for ending in self.indian_endings:
-            if word.lower().endswith(ending):
-                return True, 0.9, f"Matches Indian name pattern (ends with {ending})"
-     
+        match = self._ending_matcher.search(word.lower())
+        if match:
+            return True, 0.9, f"Matches Indian name pattern (ends with {match.group(1)})"
             
         return False, 0.2, "No strong indicators of being a name"
         
@@ -71,6 +81,15 @@ class NameChecker:
             
         return True
 
+_name_checker = None
+
+def get_name_checker():
+    """Return the process wide NameChecker, the names corpus is loaded only once"""
+    global _name_checker
+    if _name_checker is None:
+        _name_checker = NameChecker()
+    return _name_checker
+
 def test_name(checker, name):
     """Test a name and print results"""
     is_name, confidence, method = checker.is_likely_name(name)
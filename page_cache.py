@@ -0,0 +1,67 @@
+import hashlib
+import os
+import sqlite3
+
+PAGE_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'pages.sqlite3')
+
+
+def file_hash(path, block_size=1 << 20):
+    """sha256 of a file's content, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PageCache:
+    """
+    On-disk cache of extracted PDF pages keyed by (PDF content hash, page index, cleaner version).
+    A changed PDF gets a new hash and a changed cleaner a new version, so stale pages are never served.
+    """
+
+    def __init__(self, path: str = PAGE_CACHE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                pdf_hash TEXT PRIMARY KEY,
+                page_count INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                pdf_hash TEXT NOT NULL,
+                page_index INTEGER NOT NULL,
+                cleaner_version TEXT NOT NULL,
+                raw_text TEXT NOT NULL,
+                cleaned_text TEXT NOT NULL,
+                PRIMARY KEY (pdf_hash, page_index, cleaner_version)
+            );
+        """)
+
+    def page_count(self, pdf_hash: str):
+        """Number of pages of a known PDF, None if the PDF was never seen"""
+        row = self.conn.execute("SELECT page_count FROM documents WHERE pdf_hash = ?", (pdf_hash,)).fetchone()
+        return row[0] if row else None
+
+    def set_page_count(self, pdf_hash: str, page_count: int):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO documents (pdf_hash, page_count) VALUES (?, ?)",
+                              (pdf_hash, page_count))
+
+    def get_pages(self, pdf_hash: str, cleaner_version: str, page_indices):
+        """Return {page_index: (raw_text, cleaned_text)} for the cached pages among page_indices"""
+        wanted = set(page_indices)
+        rows = self.conn.execute(
+            "SELECT page_index, raw_text, cleaned_text FROM pages WHERE pdf_hash = ? AND cleaner_version = ?",
+            (pdf_hash, cleaner_version))
+        return {index: (raw, cleaned) for index, raw, cleaned in rows if index in wanted}
+
+    def put_page(self, pdf_hash: str, page_index: int, cleaner_version: str, raw_text: str, cleaned_text: str):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages (pdf_hash, page_index, cleaner_version, raw_text, cleaned_text) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (pdf_hash, page_index, cleaner_version, raw_text, cleaned_text))
+
+    def close(self):
+        self.conn.close()
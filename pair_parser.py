@@ -0,0 +1,52 @@
+import json
+from typing import Dict, Iterator, List, Tuple
+
+ROLES = ('user', 'assistant')
+
+_decoder = json.JSONDecoder()
+
+
+def _valid_message(value) -> bool:
+    return (isinstance(value, dict) and value.get('role') in ROLES
+            and isinstance(value.get('content'), str) and bool(value['content'].strip()))
+
+
+def iter_messages(text: str) -> Iterator[Dict]:
+    """
+    Every complete {"role": ..., "content": ...} JSON object of a model response, in order.
+
+    Objects are decoded wherever they start, so one pair per line, a single list spread over
+    several lines or a response cut off mid-object all give back their complete messages.
+    Malformed objects are skipped instead of failing the whole response.
+    """
+    position = text.find('{')
+    while position != -1:
+        try:
+            value, end = _decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            position = text.find('{', position + 1)
+            continue
+        if _valid_message(value):
+            yield {'role': value['role'], 'content': value['content']}
+            position = text.find('{', end)
+        else:
+            # a wrapping object, look for messages inside it
+            position = text.find('{', position + 1)
+
+
+def parse_pairs(text: str) -> List[Tuple[Dict, Dict]]:
+    """(user, assistant) message pairs of a response, messages without their counterpart are dropped"""
+    pairs = []
+    pending_user = None
+    for message in iter_messages(text):
+        if message['role'] == 'user':
+            pending_user = message
+        elif pending_user is not None:
+            pairs.append((pending_user, message))
+            pending_user = None
+    return pairs
+
+
+def flatten_pairs(pairs: List[Tuple[Dict, Dict]]) -> List[Dict]:
+    """Pairs as the alternating user / assistant message list written to the JSONL datasets"""
+    return [message for pair in pairs for message in pair]
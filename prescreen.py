@@ -0,0 +1,79 @@
+import re
+from typing import List, Optional, Set
+
+# same rule as InstructionDatasetCreator.validate_dataset
+MIN_RESPONSE_CHARS = 50
+# share of repeated word trigrams above which a response is a generation loop
+MAX_REPETITION = 0.5
+# share of the response's content words found in its source chunk below which it is not grounded
+MIN_SOURCE_OVERLAP = 0.1
+# content words a response needs before its overlap is meaningful
+MIN_OVERLAP_WORDS = 8
+
+_word = re.compile(r"\w+")
+
+
+def _words(text: str) -> List[str]:
+    return _word.findall(text.lower())
+
+
+def instruction_key(instruction: str) -> str:
+    """Instruction as compared for duplicates : lower case words, punctuation and spacing ignored"""
+    return ' '.join(_words(instruction))
+
+
+def repetition(text: str, n: int = 3) -> float:
+    """Share of the word n-grams of a text that repeat an earlier one, 0 for texts shorter than 2 n-grams"""
+    words = _words(text)
+    grams = [tuple(words[i:i + n]) for i in range(len(words) - n + 1)]
+    if len(grams) < 2:
+        return 0.0
+    return 1 - len(set(grams)) / len(grams)
+
+
+def source_overlap(response: str, source: str) -> Optional[float]:
+    """Share of the response's content words (longer than 3 letters) found in the source, None when too few"""
+    content = [word for word in _words(response) if len(word) > 3]
+    if len(content) < MIN_OVERLAP_WORDS:
+        return None
+    source_words = set(_words(source))
+    return sum(word in source_words for word in content) / len(content)
+
+
+def screen_pair(instruction: str, response: str, source: str = None) -> Optional[str]:
+    """Reason to reject a pair without judging it, None when it needs the judge"""
+    if not instruction.strip():
+        return "empty instruction"
+    if not response.strip():
+        return "empty response"
+    if len(response) < MIN_RESPONSE_CHARS:
+        return f"response shorter than {MIN_RESPONSE_CHARS} characters"
+    if repetition(response) > MAX_REPETITION:
+        return "repetitive response"
+    if source:
+        overlap = source_overlap(response, source)
+        if overlap is not None and overlap < MIN_SOURCE_OVERLAP:
+            return f"response not grounded in its source ({overlap:.0%} word overlap)"
+    return None
+
+
+def screen_pairs(pairs: List, seen: Set[str] = None) -> List[Optional[str]]:
+    """
+    Rejection reason of each pair (objects with instruction, response and optional source), None
+    for pairs to forward to the judge.
+
+    Only clear failures are rejected, so the pairs the judge would accept are all forwarded.
+    An instruction already in seen, or earlier in pairs, is rejected as a duplicate; pass the
+    same set across calls to catch duplicates between windows of a file.
+    """
+    seen = set() if seen is None else seen
+    reasons = []
+    for pair in pairs:
+        reason = screen_pair(pair.instruction, pair.response, getattr(pair, 'source', None))
+        key = instruction_key(pair.instruction)
+        if reason is None and key in seen:
+            reason = "duplicate instruction"
+        if reason is None:
+            seen.add(key)
+        reasons.append(reason)
+    return reasons
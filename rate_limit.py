@@ -0,0 +1,90 @@
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+
+
+class TokenBucket:
+    """
+    Bucket refilled continuously at capacity per minute, the way API quotas are replenished.
+    Starts full so a fresh run can use its burst allowance straight away.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount can be taken, 0 if available now"""
+        self._refill(now)
+        # a single request larger than the bucket would wait forever, let it drain the bucket instead
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount):
+        # may go negative when a request is larger than the bucket or usage is corrected upward
+        self.level -= amount
+
+    def give_back(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """
+    asyncio limiter enforcing requests per minute and tokens per minute.
+
+    Callers reserve an estimate of the tokens a request will use with acquire(), and
+    correct it with settle() once the actual usage is known.
+    """
+
+    def __init__(self, requests_per_minute: float = 50, tokens_per_minute: float = 40000):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int = 0):
+        # callers are served one at a time, in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                delay = 0.0
+                if self.requests:
+                    delay = max(delay, self.requests.wait_time(1, now))
+                if self.tokens:
+                    delay = max(delay, self.tokens.wait_time(tokens, now))
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+
+    def settle(self, reserved: int, used: int):
+        """Correct a reservation with the tokens the request actually used"""
+        if not self.tokens:
+            return
+        if used < reserved:
+            self.tokens.give_back(reserved - used)
+        else:
+            self.tokens.take(used - reserved)
+
+
+def retry_after_seconds(headers, default: float = 1.0) -> float:
+    """Delay requested by a retry-after header (seconds or HTTP date), default when missing"""
+    value = headers.get('retry-after') if headers is not None else None
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict
+
+RESPONSE_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'responses.sqlite3')
+
+
+def request_temperature(params: Dict) -> float:
+    """Temperature of messages.create parameters, given as an argument or in extra_body"""
+    return float(params.get('temperature', params.get('extra_body', {}).get('temperature', 1.0)))
+
+
+def prompt_hash(params: Dict) -> str:
+    """sha256 of the request parameters other than model and temperature (messages, system, max_tokens ...)"""
+    prompt = {name: value for name, value in params.items() if name not in ('model', 'temperature', 'extra_body')}
+    extra_body = {name: value for name, value in params.get('extra_body', {}).items() if name != 'temperature'}
+    if extra_body:
+        prompt['extra_body'] = extra_body
+    return hashlib.sha256(json.dumps(prompt, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    On-disk cache of LLM responses keyed by (model, temperature, prompt hash, sample index).
+
+    The sample index tells apart several samples drawn for the same prompt, so a rerun gets
+    back the same samples instead of the first one several times. Least recently used
+    responses are evicted once the cached text exceeds max_bytes.
+    """
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, max_bytes: int = 256 * 1024 * 1024):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # shared by the worker threads of a run
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                model TEXT NOT NULL,
+                temperature REAL NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                sample_index INTEGER NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, temperature, prompt_hash, sample_index)
+            );
+            CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+        """)
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def _key(params: Dict, sample_index: int):
+        return params['model'], request_temperature(params), prompt_hash(params), sample_index
+
+    def get(self, params: Dict, sample_index: int = 0):
+        """Cached response text for the messages.create parameters, None on a miss"""
+        key = self._key(params, sample_index)
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT response FROM responses WHERE model = ? AND temperature = ? AND prompt_hash = ? "
+                "AND sample_index = ?", key).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self.conn:
+                self.conn.execute(
+                    "UPDATE responses SET last_used = ? WHERE model = ? AND temperature = ? AND prompt_hash = ? "
+                    "AND sample_index = ?", (time.time(), *key))
+            return row[0]
+
+    def put(self, params: Dict, sample_index: int, response: str):
+        key = self._key(params, sample_index)
+        size = len(response.encode('utf-8'))
+        with self._lock, self.conn:
+            old = self.conn.execute(
+                "SELECT size FROM responses WHERE model = ? AND temperature = ? AND prompt_hash = ? "
+                "AND sample_index = ?", key).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (model, temperature, prompt_hash, sample_index, response, size, "
+                "last_used) VALUES (?, ?, ?, ?, ?, ?, ?)", (*key, response, size, time.time()))
+            self.total_bytes += size - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least recently used responses until the cache fits in max_bytes"""
+        rows = self.conn.execute("SELECT rowid, size FROM responses ORDER BY last_used")
+        evicted = []
+        for rowid, size in rows:
+            if self.total_bytes <= self.max_bytes:
+                break
+            evicted.append((rowid,))
+            self.total_bytes -= size
+        self.conn.executemany("DELETE FROM responses WHERE rowid = ?", evicted)
+
+    def invalidate(self, model: str = None) -> int:
+        """Drop every cached response, or those of one model, returns the number dropped"""
+        with self._lock, self.conn:
+            if model is None:
+                dropped = self.conn.execute("DELETE FROM responses").rowcount
+            else:
+                dropped = self.conn.execute("DELETE FROM responses WHERE model = ?", (model,)).rowcount
+            self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        return dropped
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {'entries': entries, 'bytes': self.total_bytes, 'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Dict, List, Tuple
+
+STATUSES = ('pending', 'done', 'failed')
+
+
+def chunk_hash(chunk: Dict) -> str:
+    """sha256 of a chunk's text, the same chunk of a rerun gets the same key"""
+    return hashlib.sha256(chunk['text'].encode('utf-8')).hexdigest()
+
+
+class RunManifest:
+    """
+    SQLite manifest of a generation run writing to an append-only JSONL output file.
+
+    Chunks are keyed by content hash with a pending / done / failed status. The rows of a
+    chunk are appended and synced to the output file, then the chunk is marked done together
+    with the new committed size of the output in one transaction. Opening the manifest
+    truncates whatever a crashed run appended past the committed size, so a rerun neither
+    duplicates nor loses rows and only generates the chunks that are not done.
+    """
+
+    def __init__(self, output_file: str, path: str = None):
+        self.output_file = output_file
+        self.path = path or f"{output_file}.manifest.sqlite3"
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_hash TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                pairs INTEGER NOT NULL DEFAULT 0,
+                error TEXT
+            );
+            CREATE TABLE IF NOT EXISTS output (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                committed_size INTEGER NOT NULL
+            );
+        """)
+        self._recover_output()
+
+    def _recover_output(self):
+        size = os.path.getsize(self.output_file) if os.path.exists(self.output_file) else 0
+        row = self.conn.execute("SELECT committed_size FROM output WHERE id = 0").fetchone()
+        if row is None or size < row[0]:
+            if row is not None:
+                print(f"{self.output_file} is smaller than its manifest records, keeping it as is")
+            self._set_committed_size(size)
+        elif size > row[0]:
+            print(f"Dropping {size - row[0]} bytes of uncommitted rows from {self.output_file}")
+            with open(self.output_file, 'r+b') as f:
+                f.truncate(row[0])
+
+    def _set_committed_size(self, size: int):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO output (id, committed_size) VALUES (0, ?)", (size,))
+
+    def start(self, chunks: List[Dict], retry_failed: bool = True) -> List[Tuple[str, Dict]]:
+        """Register the chunks of a run and return (chunk_hash, chunk) for those still to generate"""
+        keyed = [(chunk_hash(chunk), chunk) for chunk in chunks]
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO chunks (chunk_hash, status) VALUES (?, 'pending')",
+                                  [(key,) for key, _ in keyed])
+        skip = {'done', 'failed'} if not retry_failed else {'done'}
+        statuses = self.statuses([key for key, _ in keyed])
+        todo = []
+        seen = set()
+        for key, chunk in keyed:
+            # identical chunks are generated once
+            if statuses.get(key) not in skip and key not in seen:
+                todo.append((key, chunk))
+                seen.add(key)
+        return todo
+
+    def statuses(self, keys: List[str]) -> Dict[str, str]:
+        result = {}
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT chunk_hash, status FROM chunks WHERE chunk_hash IN ({','.join('?' * len(batch))})", batch)
+            result.update(rows)
+        return result
+
+    def commit(self, key: str, items: List[Dict]):
+        """Append a chunk's rows to the output file in one synced write and mark the chunk done"""
+        data = ''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in items).encode('utf-8')
+        with open(self.output_file, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        with self.conn:
+            self.conn.execute("UPDATE chunks SET status = 'done', attempts = attempts + 1, pairs = ?, error = NULL "
+                              "WHERE chunk_hash = ?", (len(items), key))
+            self.conn.execute("UPDATE output SET committed_size = ? WHERE id = 0", (size,))
+
+    def fail(self, key: str, error: Exception):
+        with self.conn:
+            self.conn.execute("UPDATE chunks SET status = 'failed', attempts = attempts + 1, error = ? "
+                              "WHERE chunk_hash = ?", (str(error), key))
+
+    def summary(self) -> Dict[str, int]:
+        """Number of chunks in each status"""
+        counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM chunks GROUP BY status"))
+        return {status: counts.get(status, 0) for status in STATUSES}
+
+    def close(self):
+        self.conn.close()
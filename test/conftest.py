@@ -0,0 +1,52 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    '''Passes every request to the server's respond callback and writes back what it returns'''
+
+    def _handle(self):
+        length = int(self.headers.get('content-length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        status, payload, *headers = self.server.respond(self.command, self.path, self.headers, body)
+        headers = headers[0] if headers else {}
+        if isinstance(payload, bytes):
+            data = payload
+        else:
+            data = json.dumps(payload).encode('utf-8')
+            headers = {'content-type': 'application/json', **headers}
+        self.send_response(status)
+        self.send_header('content-length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    '''
+    Start local API stubs : start(respond) serves respond(method, path, headers, json_body), which
+    returns (status, payload) or (status, payload, headers), and gives back the stub's base url.
+    A dict payload is sent as JSON, bytes as they are. Stubs are shut down after the test.
+    '''
+    servers = []
+
+    def start(respond):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+        server.respond = respond
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_port}'
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
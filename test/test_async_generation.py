@@ -0,0 +1,76 @@
+import asyncio
+import json
+import threading
+import time
+from context_inst_gen import ContextualInstructionGenerator
+from rate_limit import RateLimiter, retry_after_seconds
+
+PAIRS = ('[{"role": "user", "content": "What changed in August?"}, {"role": "assistant", "content": "A rebellion."}]\n'
+         '[{"role": "user", "content": "Who led it?"}, {"role": "assistant", "content": "Students."}]')
+
+
+class StubMessages:
+    '''Anthropic messages endpoint stub : rate limits the first request, answers the others after a delay'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.temperatures = set()
+
+    def __call__(self, method, path, headers, body):
+        with self.lock:
+            self.requests += 1
+            self.temperatures.add(body.get('temperature'))
+            first = self.requests == 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if first:
+                return 429, {"type": "error", "error": {"type": "rate_limit_error", "message": "slow down"}}, \
+                    {'retry-after': '0.2'}
+            time.sleep(0.05)
+            return 200, {"id": "msg_1", "type": "message", "role": "assistant", "model": "stub",
+                         "content": [{"type": "text", "text": PAIRS}], "stop_reason": "end_turn",
+                         "stop_sequence": None, "usage": {"input_tokens": 100, "output_tokens": 50}}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def test_async_generation(tmp_path, stub_server):
+    '''chunks are generated concurrently within the limit and the 429 is retried after its delay'''
+    stub = StubMessages()
+    generator = ContextualInstructionGenerator('test-key', base_url=stub_server(stub))
+    chunks = [{'text': f'chunk {i}', 'topics': ['india']} for i in range(12)]
+    output_file = tmp_path / 'instructions.jsonl'
+    start = time.perf_counter()
+    stats = asyncio.run(generator.aprocess_chunks(chunks, str(output_file), concurrency=4,
+                                                  requests_per_minute=6000, tokens_per_minute=10 ** 6))
+    seconds = time.perf_counter() - start
+    print(f"stats : {stats}, max in flight : {stub.max_in_flight}")
+    assert stats['failed'] == 0 and stats['pairs'] == 48
+    rows = [json.loads(line) for line in output_file.read_text(encoding='utf-8').splitlines()]
+    assert len(rows) == 48
+    # user lines carry the chunk the pair was generated from, for the judge's grounding check
+    assert {row['source'] for row in rows if row['role'] == 'user'} == {chunk['text'] for chunk in chunks}
+    assert all('source' not in row for row in rows if row['role'] == 'assistant')
+    assert stub.requests == 13
+    assert stub.temperatures == {0.7}
+    assert 1 < stub.max_in_flight <= 4
+    assert seconds >= 0.2
+
+
+def test_rate_limiter():
+    '''once the burst allowance is used, requests wait for the bucket to refill'''
+    async def run():
+        limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=None)
+        for _ in range(600):
+            await limiter.acquire()
+        start = time.perf_counter()
+        await limiter.acquire()
+        return time.perf_counter() - start
+    assert 0.05 < asyncio.run(run()) < 1
+    assert retry_after_seconds({'retry-after': '3'}) == 3.0
+    assert retry_after_seconds({}, default=2.0) == 2.0
@@ -0,0 +1,108 @@
+import json
+import pytest
+from context_inst_gen import ContextualInstructionGenerator
+from llm_generate import ConversationDatasetCreator
+from run_manifest import RunManifest, chunk_hash
+
+BATCH = {"id": "msgbatch_1", "type": "message_batch", "created_at": "2025-01-06T00:00:00Z",
+         "expires_at": "2025-01-07T00:00:00Z",
+         "request_counts": {"processing": 0, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}}
+
+
+def _pair(custom_id):
+    return (f'[{{"role": "user", "content": "question {custom_id}"}}, '
+            f'{{"role": "assistant", "content": "answer {custom_id}"}}]')
+
+
+class FakeBatches:
+    '''Message Batches API fake : batches end from the second poll on, requests whose id is in errored error'''
+
+    def __init__(self, errored=()):
+        self.errored = set(errored)
+        self.submissions = []
+        self.polls = 0
+
+    def __call__(self, method, path, headers, body):
+        if method == 'POST':
+            self.submissions.append([request['custom_id'] for request in body['requests']])
+            assert all(request['params']['temperature'] == 0.7 for request in body['requests'])
+            self.polls = 0
+            return 200, {**BATCH, "processing_status": "in_progress"}
+        if path.endswith('/results'):
+            lines = []
+            for custom_id in self.submissions[-1]:
+                if custom_id in self.errored:
+                    result = {"type": "errored", "error": {"type": "error", "error": {
+                        "type": "overloaded_error", "message": "Overloaded"}}}
+                else:
+                    result = {"type": "succeeded", "message": {
+                        "id": "msg_1", "type": "message", "role": "assistant", "model": "stub",
+                        "content": [{"type": "text", "text": _pair(custom_id)}], "stop_reason": "end_turn",
+                        "stop_sequence": None, "usage": {"input_tokens": 10, "output_tokens": 5}}}
+                lines.append(json.dumps({"custom_id": custom_id, "result": result}))
+            # results are not in request order
+            return 200, '\n'.join(reversed(lines)).encode('utf-8'), {'content-type': 'application/binary'}
+        self.polls += 1
+        if self.polls < 2:
+            return 200, {**BATCH, "processing_status": "in_progress"}
+        return 200, {**BATCH, "processing_status": "ended",
+                     "results_url": f"http://{headers['host']}/v1/messages/batches/msgbatch_1/results"}
+
+
+def test_process_chunks_batch(tmp_path, stub_server, monkeypatch):
+    '''chunks go out as one batch, results are written in chunk order and a rerun resumes the batch'''
+    chunks = [{'text': f'chunk {i}', 'topics': ['india']} for i in range(5)]
+    ids = [chunk_hash(chunk) for chunk in chunks]
+    text_ids = [f"{chunk_hash({'text': text})[:48]}-{i}" for text in ('text a', 'text b') for i in range(2)]
+    batches = FakeBatches(errored={ids[2], text_ids[1], text_ids[3]})
+    base_url = stub_server(batches)
+    generator = ContextualInstructionGenerator('test-key', base_url=base_url)
+    output_file = tmp_path / 'instructions.jsonl'
+    state_file = tmp_path / 'batch.json'
+
+    # an interrupted run submitted a batch for every chunk and crashed after committing chunk 0
+    state_file.write_text(json.dumps({'batch_id': 'msgbatch_1', 'custom_ids': ids}))
+    batches.submissions.append(ids)
+    manifest = RunManifest(str(output_file))
+    manifest.start(chunks)
+    manifest.commit(ids[0], [{"role": "user", "content": f"question {ids[0]}"},
+                             {"role": "assistant", "content": f"answer {ids[0]}"}])
+    manifest.close()
+    stats = generator.process_chunks_batch(chunks, str(output_file), state_file=str(state_file),
+                                           poll_interval=0.01)
+    assert len(batches.submissions) == 1
+
+    creator = ConversationDatasetCreator('test-key', base_url=base_url)
+    # the batch of another run is not resumed for these texts
+    state_file.write_text(json.dumps({'batch_id': 'msgbatch_1', 'custom_ids': ids}))
+    with pytest.raises(ValueError):
+        creator.create_dataset_batch(['text a', 'text b'], state_file=str(state_file), poll_interval=0.01)
+    state_file.unlink()
+    monkeypatch.chdir(tmp_path)
+    dataset = creator.create_dataset_batch(['text a', 'text b', 'text a'], conversations_per_text=2,
+                                           poll_interval=0.01)
+    print(f"stats : {stats}")
+    assert stats['batch_id'] == 'msgbatch_1' and stats['skipped'] == 1
+    assert stats['failed'] == 1 and stats['pairs'] == 6
+    rows = [json.loads(line) for line in output_file.read_text(encoding='utf-8').splitlines()]
+    assert [row['content'] for row in rows[::2]] == [f'question {ids[i]}' for i in (0, 1, 3, 4)]
+    assert [row.get('source') for row in rows[2::2]] == [chunks[i]['text'] for i in (1, 3, 4)]
+    assert batches.submissions[-1] == text_ids
+    assert [item['content'] for item in dataset[::2]] == [f'question {text_ids[i]}' for i in (0, 2, 0)]
+    assert not state_file.exists()
+    # the default state file is named after the texts and removed once the batch is done
+    assert not list(tmp_path.glob('conversation_batch_*.json'))
+
+
+def test_submit_resume(tmp_path):
+    '''a rerun needing a subset of the submitted requests resumes the batch, a request it lacks does not'''
+    from batch_job import BatchJob
+    from client_pool import ClientPool
+    state_file = tmp_path / 'batch.json'
+    state_file.write_text(json.dumps({'batch_id': 'msgbatch_1', 'custom_ids': ['a', 'b', 'c'], 'key': '...key2'}))
+    job = BatchJob(ClientPool(['test-key1', 'test-key2']), str(state_file))
+    assert job.submit([{'custom_id': 'c', 'params': {}}, {'custom_id': 'a', 'params': {}}]) == 'msgbatch_1'
+    # polled with the key that submitted the batch
+    assert job.client is job.pool.keys[1].client
+    with pytest.raises(ValueError):
+        job.submit([{'custom_id': 'a', 'params': {}}, {'custom_id': 'd', 'params': {}}])
@@ -0,0 +1,117 @@
+import pytest
+from context_inst_gen import ContextualInstructionGenerator
+
+spacy = pytest.importorskip('spacy')
+
+TEXT = """India voted in seven phases. Turnout was high in the east.
+
+Counting began on a Tuesday. The results surprised many analysts. Markets rallied the next day."""
+
+
+def _generator():
+    '''generator chunking with a blank English pipeline and a rule based sentencizer, no model download'''
+    generator = ContextualInstructionGenerator('test-key')
+    generator._nlp = spacy.blank('en')
+    generator._nlp.add_pipe('sentencizer')
+    return generator
+
+
+def test_chunking_keeps_sentencizer():
+    '''a sentencizer is not disabled while chunking, it is what splits the sentences'''
+    chunks = _generator().create_contextual_chunks(TEXT, max_chunk_size=40, overlap_sentences=0)
+    print(f"chunks : {chunks}")
+    assert [chunk['text'] for chunk in chunks] == [
+        'India voted in seven phases.', 'Turnout was high in the east.',
+        'Counting began on a Tuesday.', 'The results surprised many analysts.', 'Markets rallied the next day.']
+
+STORY = """The monsoon arrived early in Kerala this year. Farmers welcomed the rain. Reservoirs filled within weeks.
+
+In Delhi the heat wave continued. Power demand reached a record. The grid held up.
+
+Economists expect a good harvest. Food prices may ease by winter."""
+
+
+def _baseline_chunks(nlp, text, max_chunk_size):
+    '''text and size of the chunks of the original chunker : one sentence overlap, sizes in characters'''
+    chunks = []
+    current_chunk = []
+    current_size = 0
+    for para in [p.strip() for p in text.split('\n\n') if p.strip()]:
+        for sent in nlp(para).sents:
+            sent_text = sent.text.strip()
+            if current_size + len(sent_text) > max_chunk_size and current_chunk:
+                chunks.append((' '.join(current_chunk), current_size))
+                current_chunk = [current_chunk[-1]]
+                current_size = len(current_chunk[0])
+            current_chunk.append(sent_text)
+            current_size += len(sent_text)
+    if current_chunk:
+        chunks.append((' '.join(current_chunk), current_size))
+    return chunks
+
+
+def test_chunks_match_baseline():
+    '''default chunking gives the chunks of the original chunker, with offsets into the text'''
+    generator = _generator()
+    for max_chunk_size in (30, 60, 100, 2000):
+        chunks = generator.create_contextual_chunks(STORY, max_chunk_size=max_chunk_size)
+        assert [(chunk['text'], chunk['size']) for chunk in chunks] == \
+            _baseline_chunks(generator.nlp, STORY, max_chunk_size)
+        for chunk in chunks:
+            assert STORY[chunk['start']:chunk['end']].split() == chunk['text'].split()
+
+
+def test_chunk_options():
+    '''overlap_sentences, fill_ratio and size_unit change how chunks are filled'''
+    generator = _generator()
+    no_overlap = generator.create_contextual_chunks(STORY, max_chunk_size=80, overlap_sentences=0)
+    assert ' '.join(chunk['text'] for chunk in no_overlap) == ' '.join(STORY.split())
+    assert all(chunk['size'] <= 80 for chunk in no_overlap)
+
+    overlap = generator.create_contextual_chunks(STORY, max_chunk_size=80, overlap_sentences=2)
+    for previous, chunk in zip(overlap, overlap[1:]):
+        # the new chunk starts with the last sentences of the previous one, never all of them
+        assert chunk['start'] > previous['start'] and chunk['start'] < previous['end']
+
+    assert generator.create_contextual_chunks(STORY, max_chunk_size=160, fill_ratio=0.5) == \
+        generator.create_contextual_chunks(STORY, max_chunk_size=80)
+
+    generator._count_tokens = lambda text: len(text.split())
+    tokens = generator.create_contextual_chunks(STORY, max_chunk_size=12, size_unit='tokens', overlap_sentences=0)
+    assert [chunk['size'] for chunk in tokens] == [len(chunk['text'].split()) for chunk in tokens]
+    assert all(chunk['size'] <= 12 for chunk in tokens) and len(tokens) > 1
+
+    with pytest.raises(ValueError):
+        generator.create_contextual_chunks(STORY, size_unit='words')
+    with pytest.raises(ValueError):
+        generator.create_contextual_chunks(STORY, fill_ratio=0)
+
+
+def test_chunk_corpus(tmp_path):
+    '''a corpus is chunked into a JSONL store, record per chunk, as each document is chunked alone'''
+    from context_inst_gen import iter_chunk_store
+    generator = _generator()
+    documents = [('story.txt', STORY), ('text.txt', TEXT)]
+    output_file = str(tmp_path / 'chunks.jsonl')
+    stats = generator.chunk_corpus(documents, output_file, max_chunk_size=80)
+    records = list(iter_chunk_store(output_file))
+    assert stats == {'documents': 2, 'chunks': len(records)}
+    for doc_id, text in documents:
+        doc_records = [record for record in records if record['doc_id'] == doc_id]
+        chunks = generator.create_contextual_chunks(text, max_chunk_size=80)
+        assert [record['chunk_index'] for record in doc_records] == list(range(len(chunks)))
+        assert [{key: value for key, value in record.items() if key not in ('doc_id', 'chunk_index')}
+                for record in doc_records] == chunks
+
+    # the same corpus read from a directory of .txt files
+    corpus = tmp_path / 'corpus'
+    corpus.mkdir()
+    for doc_id, text in documents:
+        (corpus / doc_id).write_text(text, encoding='utf-8')
+    generator.chunk_corpus(str(corpus), str(tmp_path / 'dir_chunks.jsonl'), max_chunk_size=80)
+    assert list(iter_chunk_store(str(tmp_path / 'dir_chunks.jsonl'))) == records
+
+    # two documents in a row with the same id are chunked apart, not as one document
+    generator.chunk_corpus([('same.txt', STORY), ('same.txt', STORY)], output_file, max_chunk_size=80)
+    indices = [record['chunk_index'] for record in iter_chunk_store(output_file)]
+    assert indices == 2 * list(range(len(generator.create_contextual_chunks(STORY, max_chunk_size=80))))
@@ -0,0 +1,37 @@
+import os
+import pytest
+
+pytest.importorskip('enchant', exc_type=ImportError)
+import clean_file_text
+
+
+class UpperRepairer:
+    '''stands in for the word boundary repairer, marks every block it cleaned'''
+
+    def repair_page(self, text):
+        return text.upper()
+
+
+def test_clean_directory(tmp_path, monkeypatch):
+    '''pages are split into blocks, cleaned in worker processes and written back whole and in order'''
+    lexicon_calls = []
+    monkeypatch.setattr(clean_file_text, 'get_lexicon', lambda: lexicon_calls.append(os.getpid()))
+    monkeypatch.setattr(clean_file_text, 'get_repairer', UpperRepairer)
+    input_dir = tmp_path / 'extracted_text'
+    input_dir.mkdir()
+    pages = {'page_2.txt': 'first line\nsecond line\nthird line', 'page_10.txt': 'only line\n', 'page_3.txt': ''}
+    for name, text in pages.items():
+        (input_dir / name).write_text(text, encoding='utf-8')
+    output_dir = tmp_path / 'clean_text'
+    output_dir.mkdir()
+    (output_dir / 'page_2.txt').write_text('stale page', encoding='utf-8')
+
+    stats = clean_file_text.clean_directory(str(input_dir), str(output_dir), workers=2, block_lines=1)
+    print(f"stats : {stats}")
+    assert stats['pages'] == 3
+    # the lexicon is loaded once, in the parent, before the workers start
+    assert lexicon_calls[0] == os.getpid()
+    assert (output_dir / 'page_2.txt').read_text(encoding='utf-8') == 'FIRST LINE\nSECOND LINE\nTHIRD LINE\n'
+    assert (output_dir / 'page_10.txt').read_text(encoding='utf-8') == 'ONLY LINE\n'
+    assert (output_dir / 'page_3.txt').read_text(encoding='utf-8') == ''
+    assert sorted(os.listdir(output_dir)) == ['page_10.txt', 'page_2.txt', 'page_3.txt']
@@ -0,0 +1,53 @@
+import os
+import re
+import subprocess
+import sys
+import json
+from context_inst_file import *
+
+
+def test_collapse_whitespace():
+    '''same result as collapsing whitespace runs with a regex'''
+    for text in ['', ' ', 'a', ' a  b\n\nc\t', '\n\x85a\xa0b ']:
+        assert collapse_whitespace(text) == re.sub(r'\s+', ' ', text)
+
+def test_fix_characters():
+    text = 'The studentâ€™s coup — wasn’t â€œcleanâ€'
+    cleaned = clean_text2(text)
+    print(f"cleaned text : {cleaned}")
+    assert cleaned == 'The student\'s coup - wasn\'t "clean"'
+
+def test_remove_boilerplate():
+    text = 'Read more at www.indiatoday.in today. FOR SUBSCRIPTION ASSISTANCE call us'
+    cleaned = remove_boilerplate(text)
+    print(f"cleaned text : {cleaned}")
+    assert cleaned == 'Read more at  today. '
+
+def test_clean_text_paragraphs():
+    text = """12 INDIA TODAY JANUARY 6, 2025 Just  five months ago, India viewed Bangladesh
+as a success. However, that changed in August. Its leaders avow their faith."""
+    cleaned = clean_text(text)
+    print(f"cleaned text : {cleaned}")
+    assert cleaned == ('Just five months ago, India viewed Bangladesh as a success\n\n'
+                       'However, that changed in August Its leaders avow their faith.')
+
+def test_publication_rules(tmp_path):
+    '''rules of another publication are loaded from a rule file and applied in one pass'''
+    rules_file = tmp_path / 'rules.json'
+    rules_file.write_text(json.dumps({
+        "the_week": {
+            "headers": [{"anchor": "the week", "pattern": r"THE WEEK \d+ [A-Z]+ \d{4}"}],
+            "boilerplate": [{"anchor": "subscribe", "pattern": "To subscribe.*", "flags": "is"}]
+        }
+    }))
+    normalizer = TextNormalizer(load_rule_set(str(rules_file)))
+    cleaned = normalizer.clean_text2('THE WEEK 12 JANUARY 2025 Markets rallied. To subscribe call\n1800')
+    print(f"cleaned text : {cleaned}")
+    assert cleaned == 'Markets rallied.'
+
+def test_import_without_llm_stack():
+    '''cleaning is importable without loading spaCy or the Anthropic client'''
+    code = "import sys, context_inst_file; print(sorted({'spacy', 'anthropic'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.stdout.strip() == '[]'
@@ -0,0 +1,82 @@
+import asyncio
+import threading
+import anthropic
+import pytest
+from client_pool import ClientPool, load_api_keys
+
+MESSAGE = {"id": "msg_1", "type": "message", "role": "assistant", "model": "stub",
+           "content": [{"type": "text", "text": "ok"}], "stop_reason": "end_turn", "stop_sequence": None,
+           "usage": {"input_tokens": 10, "output_tokens": 5}}
+
+
+class StubKeys:
+    '''Messages endpoint stub : key-throttled is always rate limited, key-invalid is rejected'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def __call__(self, method, path, headers, body):
+        api_key = headers['x-api-key']
+        with self.lock:
+            self.calls[api_key] = self.calls.get(api_key, 0) + 1
+        if api_key == 'key-throttled':
+            return 429, {"type": "error", "error": {"type": "rate_limit_error", "message": "slow down"}}, \
+                {'retry-after': '30'}
+        if api_key == 'key-invalid':
+            return 401, {"type": "error", "error": {"type": "authentication_error", "message": "bad key"}}
+        return 200, MESSAGE
+
+
+def test_client_pool(stub_server):
+    '''requests round robin over the keys, a throttled key cools down without stalling the others'''
+    stub = StubKeys()
+    pool = ClientPool(['key-a', 'key-throttled', 'key-b', 'key-invalid'], base_url=stub_server(stub))
+    params = {'model': 'stub', 'max_tokens': 10, 'messages': [{"role": "user", "content": "hi"}]}
+    for _ in range(6):
+        assert pool.create_message(**params).content[0].text == 'ok'
+
+    async def run():
+        pool.set_rate_limits(requests_per_minute=600, tokens_per_minute=None)
+        try:
+            return await asyncio.gather(*(pool.acreate_message(**params) for _ in range(6)))
+        finally:
+            await pool.aclose()
+    assert len(asyncio.run(run())) == 6
+    stats = {state['key']: state for state in pool.stats()}
+    print(f"stats : {stats}")
+    # the throttled key was tried once then cooled down for its retry-after, the invalid one dropped
+    assert stub.calls['key-throttled'] == 1 and stub.calls['key-invalid'] == 1
+    assert stub.calls['key-a'] == stub.calls['key-b'] == 6
+    assert stats['...tled']['rate_limited'] == 1 and stats['...alid']['disabled']
+
+
+def test_failed_request_refund(stub_server):
+    '''tokens reserved for a request that fails are given back to the key's limiter'''
+    pool = ClientPool(['key-throttled'], base_url=stub_server(StubKeys()))
+    pool.set_rate_limits(requests_per_minute=600, tokens_per_minute=1000)
+    params = {'model': 'stub', 'max_tokens': 10, 'messages': [{"role": "user", "content": "hi"}]}
+
+    async def run():
+        try:
+            await pool.acreate_message(reserved_tokens=500, max_attempts=1, **params)
+        finally:
+            await pool.aclose()
+    with pytest.raises(anthropic.RateLimitError):
+        asyncio.run(run())
+    assert pool.keys[0].limiter.tokens.level == 1000
+
+
+def test_load_api_keys(monkeypatch):
+    for name in ('ANTHROPIC_API_KEY', 'ANTHROPIC_API_KEY2', 'ANTHROPIC_API_KEY3', 'ANTHROPIC_API_KEY4',
+                 'ANTHROPIC_API_KEY5'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('ANTHROPIC_API_KEY', 'first')
+    monkeypatch.setenv('ANTHROPIC_API_KEY3', 'third')
+    assert load_api_keys() == ['first', 'third']
+    # a pool given no key reads them from the environment, as the SDK client would
+    assert [state.api_key for state in ClientPool(None).keys] == ['first', 'third']
+    monkeypatch.delenv('ANTHROPIC_API_KEY')
+    monkeypatch.delenv('ANTHROPIC_API_KEY3')
+    with pytest.raises(ValueError):
+        ClientPool(None)
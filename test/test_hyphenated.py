@@ -8,4 +8,29 @@ imical to India."""
     text = re.sub(r'(\w+)-\s*\n*\s*(\w+)', lambda m: handle_hyphenation(m.group(1), m.group(2)), text)
     print(text)
     
-   
\ No newline at end of file
+   
+def test_hyphenation_resolver():
+    '''lexicon decides between joined and hyphenated forms'''
+    from context_inst_file import HyphenationResolver
+    from lexicon_index import LexiconIndex
+    known = {'inimical', 'state', 'run', 'well', 'known', 'well-known'}
+    resolver = HyphenationResolver(LexiconIndex(known, frozenset(known), {}))
+    text = resolver.resolve_page("""links with radical Islamists in-
+imical to India, a state-
+run channel and well-
+known faces""")
+    print(text)
+    assert text == 'links with radical Islamists inimical to India, a state-run channel and well-known faces'
+
+
+def test_save_lexicon_concurrent(tmp_path):
+    '''concurrent writers each publish a complete index and leave no temporary file behind'''
+    from concurrent.futures import ThreadPoolExecutor
+    from lexicon_index import LexiconIndex, save_lexicon, load_lexicon
+    path = str(tmp_path / 'lexicon_index.pickle')
+    known = set(f'word{i}' for i in range(20000))
+    lexicon = LexiconIndex(known, frozenset(known), {})
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: save_lexicon(lexicon, path), range(16)))
+    assert load_lexicon(path).words == known
+    assert [p.name for p in tmp_path.iterdir()] == ['lexicon_index.pickle']
@@ -96,3 +96,43 @@ def test_broken_word3():
     processed_line = process_incorrect_words(line)
     print(f"processed line : {processed_line}" )
     
+
+def _join_with_validate_join(line):
+    '''the pairwise validate_join loop process_incorrect_words used before the repairer'''
+    words = line.split()
+    i = 0
+    while i < len(words) - 1:
+        result, _ = validate_join(words[i], words[i + 1])
+        if result:
+            words[i:i + 2] = [''.join(words[i:i + 2])]
+        else:
+            i += 1
+    return ' '.join(words)
+
+def test_repair_page():
+    '''whole page repair keeps lines and joins the words validate_join joins'''
+    page = 'The Congress par ty\n Bengal CM and TMC supr emo\n'
+    repairer = WordBoundaryRepairer()
+    repaired = repairer.repair_page(page)
+    print(f"repaired page : {repaired}")
+    lines = repaired.split('\n')
+    assert len(lines) == 3 and lines[2] == ''
+    assert lines[0].endswith(' party')
+    assert lines == [_join_with_validate_join(line) for line in page.split('\n')]
+
+def test_repairer_cache_bound():
+    '''pairs resolved while joining, not in advance, stay within max_cached_pairs'''
+    repairer = WordBoundaryRepairer(max_cached_pairs=2)
+    repairer._resolve = lambda word1, word2: True
+    for i in range(10):
+        assert repairer.should_join(f'word{i}', 'part')
+        assert len(repairer._decisions) <= 2
+
+def test_shared_name_checker():
+    '''process wide checker is reused and verdicts are cached per word'''
+    checker = get_name_checker()
+    assert checker is get_name_checker()
+    assert checker.is_likely_name('Rajesh') == checker.is_likely_name(' rajesh ')
+    is_name, confidence, method = checker.is_likely_name('Narendra')
+    assert is_name == True
+    assert method == "Matches Indian name pattern (ends with endra)"
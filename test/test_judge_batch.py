@@ -0,0 +1,252 @@
+import json
+import re
+import threading
+import time
+import pytest
+from evaluation_cache import EvaluationCache
+from llm_as_judge import LLMJudge, InstructionPair
+
+EVALUATION = {"task_adherence": {"score": 1.0, "reasoning": "addresses it"},
+              "helpfulness": {"score": 0.5, "reasoning": "short"},
+              "safety": {"score": 1.0, "reasoning": "harmless"},
+              "overall_feedback": "fine"}
+
+
+def _completion(body, content):
+    return 200, {"id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": body['model'],
+                 "choices": [{"index": 0, "finish_reason": "stop", "logprobs": None,
+                              "message": {"role": "assistant", "content": content}}],
+                 "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20}}
+
+
+class MockChat:
+    '''OpenAI compatible chat completions mock : "flaky" pairs fail once, "broken" pairs always'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seen = {}
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def __call__(self, method, path, headers, body):
+        prompt = body['messages'][-1]['content']
+        with self.lock:
+            self.seen[prompt] = self.seen.get(prompt, 0) + 1
+            self.requests.append(body['response_format']['json_schema']['name'])
+            attempt = self.seen[prompt]
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.05)
+        with self.lock:
+            self.in_flight -= 1
+        return _completion(body, self.content(prompt, attempt, body))
+
+    def content(self, prompt, attempt, body):
+        if 'broken' in prompt or ('flaky' in prompt and attempt == 1):
+            return '{"task_adherence": {"score": 1.0'
+        return json.dumps(EVALUATION)
+
+
+class MockPackedChat(MockChat):
+    '''Packed requests are answered for every pair but the second (missing) and third (score out of range)'''
+
+    def content(self, prompt, attempt, body):
+        if body['response_format']['json_schema']['name'] != 'packed_evaluation_scores':
+            return json.dumps(EVALUATION)
+        numbers = [int(number) for number in re.findall(r'^PAIR (\d+)$', prompt, re.MULTILINE)]
+        evaluations = [{**EVALUATION, "pair": number} for number in numbers if number != 2]
+        evaluations[1]["safety"] = {"score": 1.7, "reasoning": "too safe"}
+        return json.dumps({"evaluations": evaluations})
+
+
+def test_evaluate_batch(stub_server):
+    '''pairs are judged concurrently, results keep input order and evaluate_pairs reports failures'''
+    mock = MockChat()
+    judge = LLMJudge('test-key', base_url=stub_server(mock) + '/v1')
+    instructions = [f'question {i}' for i in range(10)] + ['flaky question', 'broken question']
+    pairs = [InstructionPair(instruction=instruction, response='answer') for instruction in instructions]
+    batch = judge.evaluate_pairs(pairs, concurrency=4, max_attempts=2, backoff=0.01)
+    print(f"failures : {batch.failures}, max in flight : {mock.max_in_flight}")
+    assert batch.succeeded == 11
+    assert [failure.index for failure in batch.failures] == [11]
+    assert batch.failures[0].attempts == 2 and batch.results[11] is None
+    assert all(result.weighted_score == 0.85 for result in batch.results[:11])
+    assert 1 < mock.max_in_flight <= 4
+
+    # evaluate_batch keeps its list of results and raises when a pair fails
+    results = judge.evaluate_batch(pairs[:11], concurrency=4, max_attempts=2, backoff=0.01)
+    assert [result.weighted_score for result in results] == [0.85] * 11
+    with pytest.raises(RuntimeError):
+        judge.evaluate_batch(pairs, concurrency=4, max_attempts=2, backoff=0.01)
+
+
+def test_packed_evaluation(stub_server):
+    '''pairs are scored 5 per request, a missing or invalid evaluation falls back to a single pair call'''
+    mock = MockPackedChat()
+    judge = LLMJudge('test-key', base_url=stub_server(mock) + '/v1')
+    pairs = [InstructionPair(instruction=f'question {i}', response='answer') for i in range(10)]
+    batch = judge.evaluate_pairs(pairs, concurrency=2, pack_size=5)
+    print(f"requests : {mock.requests}")
+    assert batch.succeeded == 10 and not batch.failures
+    assert all(result.weighted_score == 0.85 for result in batch.results)
+    # 2 packed requests, pairs 2 and 3 of each pack re-evaluated alone
+    assert sorted(mock.requests) == ['evaluation_scores'] * 4 + ['packed_evaluation_scores'] * 2
+
+
+class ThrottledPackedChat(MockChat):
+    '''Rate limits the first throttled requests, then scores every pair of a packed request'''
+
+    def __init__(self, throttled):
+        super().__init__()
+        self.throttled = throttled
+
+    def __call__(self, method, path, headers, body):
+        with self.lock:
+            self.requests.append(body['response_format']['json_schema']['name'])
+            self.throttled -= 1
+            throttle = self.throttled >= 0
+        if throttle:
+            return 429, {"error": {"message": "slow down", "type": "rate_limit_error"}}, {'retry-after': '0.1'}
+        numbers = re.findall(r'^PAIR (\d+)$', body['messages'][-1]['content'], re.MULTILINE)
+        return _completion(body, json.dumps({"evaluations": [{**EVALUATION, "pair": int(number)}
+                                                             for number in numbers]}))
+
+
+def test_packed_rate_limit(stub_server):
+    '''a rate limited pack is retried as a pack after retry-after, never split into single pair calls'''
+    pairs = [InstructionPair(instruction=f'question {i}', response='answer') for i in range(3)]
+    mock = ThrottledPackedChat(throttled=1)
+    judge = LLMJudge('test-key', base_url=stub_server(mock) + '/v1')
+    start = time.perf_counter()
+    batch = judge.evaluate_pairs(pairs, pack_size=3, max_attempts=3)
+    assert time.perf_counter() - start >= 0.1
+    assert batch.succeeded == 3 and mock.requests == ['packed_evaluation_scores'] * 2
+
+    # no SDK retries on top : 3 attempts are 3 requests, then every pair of the pack is reported
+    mock = ThrottledPackedChat(throttled=3)
+    judge = LLMJudge('test-key', base_url=stub_server(mock) + '/v1')
+    batch = judge.evaluate_pairs(pairs, pack_size=3, max_attempts=3, backoff=0.01)
+    print(f"failures : {batch.failures}")
+    assert mock.requests == ['packed_evaluation_scores'] * 3
+    assert [failure.index for failure in batch.failures] == [0, 1, 2]
+    assert all(failure.attempts == 3 for failure in batch.failures)
+
+
+def test_evaluate_file(tmp_path, stub_server):
+    '''a dataset file is judged window by window and a rerun resumes after the last complete row'''
+    input_file = tmp_path / 'instructions.jsonl'
+    messages = [{"role": "assistant", "content": "orphan answer"}]
+    for i in range(5):
+        messages += [{"role": "user", "content": f"file question {i}"}, {"role": "assistant", "content": "answer"}]
+    input_file.write_text(''.join(json.dumps(message) + '\n' for message in messages), encoding='utf-8')
+    output_file = tmp_path / 'evaluations.jsonl'
+
+    mock = MockChat()
+    judge = LLMJudge('test-key', base_url=stub_server(mock) + '/v1')
+    stats = judge.evaluate_file(str(input_file), str(output_file), concurrency=2, window=2)
+    assert stats['pairs'] == 5 and stats['mean_weighted_score'] == 0.85
+
+    # keep 3 rows and half of the 4th, as a crash while writing would
+    rows = output_file.read_text(encoding='utf-8').splitlines()
+    output_file.write_text('\n'.join(rows[:3]) + '\n' + rows[3][:20], encoding='utf-8')
+    stats = judge.evaluate_file(str(input_file), str(output_file), concurrency=2, window=2)
+    print(f"stats : {stats}")
+    assert stats['pairs'] == 2 and stats['resumed_from'] == json.loads(rows[2])['end']
+    rows = [json.loads(line) for line in output_file.read_text(encoding='utf-8').splitlines()]
+    assert [row['instruction'] for row in rows] == [f'file question {i}' for i in range(5)]
+    assert all(row['evaluation']['weighted_score'] == 0.85 for row in rows)
+    with open(input_file, 'rb') as f:
+        f.seek(rows[1]['offset'])
+        assert json.loads(f.readline())['content'] == 'file question 1'
+    assert mock.seen[next(p for p in mock.seen if 'file question 3' in p)] == 2
+    assert mock.seen[next(p for p in mock.seen if 'file question 0' in p)] == 1
+
+    # an output file written for another input is not resumed into the middle of a line
+    other_input = tmp_path / 'other.jsonl'
+    other_input.write_text(json.dumps({"role": "user", "content": "x" * 200}) + '\n' +
+                           json.dumps({"role": "assistant", "content": "answer"}) + '\n', encoding='utf-8')
+    with pytest.raises(ValueError, match='was not written for'):
+        judge.evaluate_file(str(other_input), str(output_file))
+
+
+def test_evaluation_cache(tmp_path, stub_server):
+    '''a cached pair is not sent again, changing the criteria weights misses the cache'''
+    cache = EvaluationCache(str(tmp_path / 'evaluations.sqlite3'))
+    mock = MockPackedChat()
+    judge = LLMJudge('test-key', base_url=stub_server(mock) + '/v1', cache=cache)
+    pairs = [InstructionPair(instruction=f'cached question {i}', response='answer') for i in range(4)]
+    judge.evaluate(pairs[0].instruction, pairs[0].response)
+    mock.requests.clear()
+    assert judge.evaluate(pairs[0].instruction, pairs[0].response).weighted_score == 0.85
+    assert mock.requests == []
+
+    # only the 3 uncached pairs are packed, pairs 2 and 3 of the pack are re-evaluated alone
+    batch = judge.evaluate_pairs(pairs, concurrency=1, pack_size=4)
+    assert batch.succeeded == 4
+    assert mock.requests == ['packed_evaluation_scores'] + ['evaluation_scores'] * 2
+    judge.evaluate_pairs(pairs, concurrency=1, pack_size=4)
+    assert len(mock.requests) == 3
+
+    judge.criteria = {"task_adherence": 0.5, "helpfulness": 0.25, "safety": 0.25}
+    assert judge.evaluate(pairs[0].instruction, pairs[0].response).weighted_score == 0.875
+    assert len(mock.requests) == 4
+    print(f"cache stats : {cache.stats()}")
+    assert cache.stats()['hits'] == 6 and cache.invalidate(judge.model) == 5
+    assert cache.stats()['entries'] == 0
+    cache.close()
+
+
+def test_prescreen(stub_server):
+    '''obvious failures are rejected locally, only the other pairs reach the judge'''
+    source = "Photosynthesis lets plants turn sunlight, water and carbon dioxide into glucose and oxygen."
+    good = "Plants use sunlight to turn water and carbon dioxide into glucose, releasing oxygen as they do."
+    pairs = [InstructionPair(instruction='screened question 0', response=good, source=source),
+             InstructionPair(instruction='screened question 1', response='Too short.'),
+             InstructionPair(instruction='Screened  question 0?', response=good),
+             InstructionPair(instruction='screened question 2', response='the same words again ' * 10),
+             InstructionPair(instruction='screened question 3', response=good,
+                             source="Rivers carry sediment from mountains down to the delta of the sea."),
+             InstructionPair(instruction='screened question 4', response=good)]
+
+    mock = MockChat()
+    judge = LLMJudge('test-key', base_url=stub_server(mock) + '/v1')
+    batch = judge.evaluate_pairs(pairs, concurrency=2, prescreen=True)
+    print(f"rejections : {batch.rejections}")
+    assert [rejection.index for rejection in batch.rejections] == [1, 2, 3, 4]
+    assert batch.rejections[1].reason == 'duplicate instruction'
+    assert [result is not None for result in batch.results] == [True, False, False, False, False, True]
+    assert not batch.failures and batch.succeeded == 2
+    assert len([prompt for prompt in mock.seen if 'screened question' in prompt]) == 2
+
+
+def test_prescreen_file(tmp_path, stub_server):
+    '''a file run checks pairs against their "source" field and catches duplicates of pairs judged before a resume'''
+    source = "Photosynthesis lets plants turn sunlight, water and carbon dioxide into glucose and oxygen."
+    good = "Plants use sunlight to turn water and carbon dioxide into glucose, releasing oxygen as they do."
+
+    def lines(*pairs):
+        return ''.join(json.dumps({"role": "user", "content": instruction, "source": source}) + '\n' +
+                       json.dumps({"role": "assistant", "content": response}) + '\n'
+                       for instruction, response in pairs)
+
+    input_file = tmp_path / 'instructions.jsonl'
+    input_file.write_text(lines(('How do plants make food?', good),
+                                ('Where do rivers go?', "Rivers carry sediment from mountains down to the delta "
+                                                        "of the sea, building wide plains along their way.")),
+                          encoding='utf-8')
+    output_file = tmp_path / 'evaluations.jsonl'
+    mock = MockChat()
+    judge = LLMJudge('test-key', base_url=stub_server(mock) + '/v1')
+    stats = judge.evaluate_file(str(input_file), str(output_file), window=1, prescreen=True)
+    assert stats['pairs'] == 2 and stats['rejected'] == 1 and stats['mean_weighted_score'] == 0.85
+
+    # more pairs generated later, one of them repeating a pair judged by the first run
+    with open(input_file, 'a', encoding='utf-8') as f:
+        f.write(lines(('How do plants make food', good), ('What does photosynthesis release?', good)))
+    stats = judge.evaluate_file(str(input_file), str(output_file), window=1, prescreen=True)
+    print(f"stats : {stats}")
+    assert stats['pairs'] == 2 and stats['rejected'] == 1
+    rows = [json.loads(line) for line in output_file.read_text(encoding='utf-8').splitlines()]
+    assert [row.get('rejected', '')[:12] for row in rows] == ['', 'response not', 'duplicate in', '']
+    assert len(mock.seen) == 2
@@ -30,3 +30,17 @@ def test_llm_as_judge():
                 
     
     
+
+def test_llm_as_judge_file(tmp_path):
+    load_dotenv()
+    judge = LLMJudge(os.getenv("OPENAI_KEY"))
+    file_path = 'instructions_file.jsonl'
+    output_file = str(tmp_path / 'evaluations_file.jsonl')
+    stats = judge.evaluate_file(file_path, output_file, concurrency=8, resume=False)
+    print(f"\nEvaluation stats : {stats}")
+    with open(output_file, 'r', encoding='utf-8') as file:
+        rows = [json.loads(line) for line in file]
+    # failed evaluations are written as rows too, they must not pass for a working judge
+    assert stats['failed'] == 0
+    assert len(rows) == stats['pairs'] == len(list(iter_message_pairs(file_path)))
+    assert all('evaluation' in row for row in rows)
@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+from context_inst_gen import ContextualInstructionGenerator
+from pair_parser import parse_pairs, flatten_pairs
+
+
+def _pair(i):
+    return f'[{{"role": "user", "content": "question {i}"}}, {{"role": "assistant", "content": "answer {i}"}}]'
+
+
+def test_parse_pairs():
+    '''complete pairs are kept from malformed lines, prose around them and a cut off last pair'''
+    text = '\n'.join(["Here are the pairs:", _pair(1),
+                      "[{'role': 'user', 'content': 'single quotes'}, {'role': 'assistant', 'content': 'x'}]",
+                      _pair(2) + ',', _pair(3)[:-30]])
+    pairs = parse_pairs(text)
+    print(f"pairs : {pairs}")
+    assert [user['content'] for user, _ in pairs] == ['question 1', 'question 2']
+    assert flatten_pairs(pairs)[1] == {"role": "assistant", "content": "answer 1"}
+
+    conversation = '''[
+    {"role": "user", "content": "What is {x}?"},
+    {"role": "assistant", "content": "It is \\"x\\"."},
+    {"role": "user", "content": "And y?"}
+]'''
+    assert flatten_pairs(parse_pairs(conversation)) == [{"role": "user", "content": "What is {x}?"},
+                                                        {"role": "assistant", "content": 'It is "x".'}]
+    assert parse_pairs('{"pairs": [' + _pair(4) + ']}')[0][0]['content'] == 'question 4'
+    assert parse_pairs('not json at all') == []
+
+
+def test_missing_pairs_requested(monkeypatch):
+    '''a response with a single pair is topped up by asking only for the missing one'''
+    prompts = []
+
+    def create_message(**params):
+        prompts.append(params['messages'][0]['content'])
+        return SimpleNamespace(content=[SimpleNamespace(text=_pair(len(prompts)) + '\n[{"role": "user", "con')])
+
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
+    generator = ContextualInstructionGenerator('test-key')
+    monkeypatch.setattr(generator.pool, 'create_message', create_message)
+    messages = generator.generate_instructions({'text': 'Some text.', 'topics': ['text']})
+    assert [message['content'] for message in messages] == ['question 1', 'answer 1', 'question 2', 'answer 2']
+    assert len(prompts) == 2
+    assert prompts[1].startswith('Generate 1 more') and '- question 1' in prompts[1]
@@ -0,0 +1,80 @@
+import os
+import fitz
+import pytest
+import context_inst_file
+import create_dataset
+from create_dataset import iter_pdf_pages
+from page_cache import PageCache, file_hash
+
+BODIES = ['Elections were held in the north.', 'The budget favoured farmers.', 'Cricket season opened early.',
+          'Monsoon rains flooded the coast.', 'Markets rallied on Friday.', 'Courts heard the appeal.']
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    '''a 6 page PDF, each page with its own body text and an INDIA TODAY footer with the page number'''
+    doc = fitz.open()
+    for number, body in enumerate(BODIES, 1):
+        page = doc.new_page()
+        page.insert_text((72, 100), body)
+        page.insert_text((72, 800), f'INDIA TODAY  {number}')
+    path = str(tmp_path / 'magazine.pdf')
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def test_parallel_extraction(pdf_path, monkeypatch):
+    '''pages extracted in a process pool come back in page order, as extracted serially'''
+    serial = list(iter_pdf_pages(pdf_path))
+    lexicon_calls = []
+    monkeypatch.setattr(context_inst_file, '_hyphenation_resolver', None)
+    monkeypatch.setattr(context_inst_file, 'get_lexicon', lambda: lexicon_calls.append(os.getpid()))
+    parallel = list(iter_pdf_pages(pdf_path, workers=2))
+    # the lexicon is loaded once, in the parent, before the workers start
+    assert lexicon_calls == [os.getpid()]
+    assert [page.page_number for page in parallel] == [1, 2, 3, 4, 5, 6]
+    assert parallel == serial
+    assert serial[1].cleaned_text == 'The budget favoured farmers. INDIA TODAY 2'
+    assert [page.page_number for page in iter_pdf_pages(pdf_path, from_page=5, to_page=99, workers=2)] == [5, 6]
+
+
+def test_page_cache(pdf_path, tmp_path, monkeypatch):
+    '''reruns only extract uncached pages and a cleaner version bump invalidates the cached ones'''
+    extracted = []
+    extract_pages = create_dataset._extract_pages
+
+    def recording_extract_pages(path, page_indices, workers=None):
+        extracted.append(list(page_indices))
+        return extract_pages(path, page_indices, workers)
+
+    monkeypatch.setattr(create_dataset, '_extract_pages', recording_extract_pages)
+    cache = PageCache(str(tmp_path / 'pages.sqlite3'))
+    first = list(iter_pdf_pages(pdf_path, from_page=3, to_page=4, cache=cache))
+    assert cache.page_count(file_hash(pdf_path)) == 6
+
+    # the page count now comes from the cache, the PDF is only opened to extract missing pages
+    monkeypatch.setattr(create_dataset, '_page_count', lambda path: pytest.fail('page count not cached'))
+    pages = list(iter_pdf_pages(pdf_path, cache=cache))
+    assert pages[2:4] == first
+    assert list(iter_pdf_pages(pdf_path, cache=cache)) == pages
+    print(f"extracted : {extracted}")
+    assert extracted == [[2, 3], [0, 1, 4, 5], []]
+
+    monkeypatch.setattr(create_dataset, 'CLEANER_VERSION', 'bumped')
+    assert list(iter_pdf_pages(pdf_path, cache=cache)) == pages
+    assert extracted[-1] == [0, 1, 2, 3, 4, 5]
+    cache.close()
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_layout_footer(pdf_path, tmp_path, workers):
+    '''repeated footers are stripped from every page, whatever range was extracted and cached first'''
+    cache = PageCache(str(tmp_path / 'pages.sqlite3'))
+    first = list(iter_pdf_pages(pdf_path, to_page=2, layout=True, cache=cache, workers=workers))
+    pages = list(iter_pdf_pages(pdf_path, layout=True, cache=cache, workers=workers))
+    cache.close()
+    print(f"pages : {pages}")
+    assert [page.cleaned_text for page in pages] == BODIES
+    assert pages[:2] == first
+    assert pages == list(iter_pdf_pages(pdf_path, layout=True))
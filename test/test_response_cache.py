@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+from llm_generate import ConversationDatasetCreator
+from response_cache import ResponseCache
+
+CONVERSATION = '''[
+    {"role": "user", "content": "question"},
+    {"role": "assistant", "content": "answer"},
+    {"role": "user", "content": "follow-up question"},
+    {"role": "assistant", "content": "follow-up answer"}
+]'''
+
+
+def _params(prompt, temperature=0.7):
+    return {'model': 'claude', 'max_tokens': 100, 'temperature': temperature,
+            'messages': [{"role": "user", "content": prompt}]}
+
+
+def test_response_cache(tmp_path):
+    '''responses are keyed by model, temperature, prompt and sample index and evicted least recently used first'''
+    path = str(tmp_path / 'responses.sqlite3')
+    cache = ResponseCache(path, max_bytes=25)
+    cache.put(_params('a'), 0, 'response a0')
+    cache.put(_params('a'), 1, 'response a1')
+    assert cache.get(_params('a'), 0) == 'response a0'
+    assert cache.get(_params('a'), 1) == 'response a1'
+    assert cache.get(_params('a', temperature=0.0), 0) is None
+    assert cache.get(_params('b'), 0) is None
+    # a temperature sent in extra_body keys the same entries
+    params = _params('a')
+    params['extra_body'] = {'temperature': params.pop('temperature')}
+    assert cache.get(params, 1) == 'response a1'
+
+    # a0 is the least recently used once a1 was read, it makes room for b0
+    cache.get(_params('a'), 1)
+    cache.put(_params('b'), 0, 'response b0')
+    assert cache.get(_params('a'), 0) is None
+    assert cache.stats()['bytes'] <= 25
+    cache.close()
+
+    cache = ResponseCache(path, max_bytes=25)
+    assert cache.get(_params('b'), 0) == 'response b0'
+    cache.close()
+
+
+def test_cached_conversations(tmp_path, monkeypatch):
+    '''a rerun is served from the cache, each sample of a text separately, unless the cache is bypassed'''
+    calls = []
+
+    def create_message(**params):
+        calls.append(params)
+        return SimpleNamespace(content=[SimpleNamespace(text=CONVERSATION)])
+
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
+    cache = ResponseCache(str(tmp_path / 'responses.sqlite3'))
+    creator = ConversationDatasetCreator('test-key', cache=cache)
+    monkeypatch.setattr(creator.pool, 'create_message', create_message)
+
+    assert len(creator.create_dataset(['text a', 'text b'], conversations_per_text=2)) == 16
+    assert len(calls) == 4
+    assert len(creator.create_dataset(['text a', 'text b'], conversations_per_text=2)) == 16
+    assert len(calls) == 4
+
+    creator.bypass_cache = True
+    creator.create_dataset(['text a'], conversations_per_text=1)
+    assert len(calls) == 5
+    print(f"cache stats : {cache.stats()}")
+    assert cache.stats()['entries'] == 4
+    cache.close()
@@ -0,0 +1,49 @@
+import json
+from context_inst_gen import ContextualInstructionGenerator
+from run_manifest import RunManifest, chunk_hash
+
+
+def test_resume_process_text(tmp_path, monkeypatch):
+    '''a rerun skips done chunks, retries the failed one and drops rows a crash left half written'''
+    chunks = [{'text': f'chunk {i}', 'topics': []} for i in range(4)]
+    calls = []
+    failures = {'chunk 2'}
+
+    def generate_instructions(chunk):
+        calls.append(chunk['text'])
+        if chunk['text'] in failures:
+            failures.discard(chunk['text'])
+            raise RuntimeError('malformed response')
+        return [{"role": "user", "content": f"question {chunk['text']}"},
+                {"role": "assistant", "content": f"answer {chunk['text']}"}]
+
+    generator = ContextualInstructionGenerator('test-key')
+    monkeypatch.setattr(generator, 'create_contextual_chunks', lambda text: chunks)
+    monkeypatch.setattr(generator, 'generate_instructions', generate_instructions)
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
+    output_file = tmp_path / 'instructions.jsonl'
+
+    summary = generator.process_text('text', str(output_file))
+    assert summary == {'pending': 0, 'done': 3, 'failed': 1}
+
+    # a crash while appending leaves a partial row past the committed size
+    with open(output_file, 'a', encoding='utf-8') as f:
+        f.write('{"role": "user", "con')
+
+    calls.clear()
+    summary = generator.process_text('text', str(output_file))
+    print(f"summary : {summary}, calls : {calls}")
+    assert calls == ['chunk 2']
+    assert summary == {'pending': 0, 'done': 4, 'failed': 0}
+    rows = [json.loads(line)['content'] for line in output_file.read_text(encoding='utf-8').splitlines()]
+    assert rows[::2] == ['question chunk 0', 'question chunk 1', 'question chunk 3', 'question chunk 2']
+
+
+def test_manifest_start(tmp_path):
+    manifest = RunManifest(str(tmp_path / 'out.jsonl'))
+    chunks = [{'text': 'a'}, {'text': 'b'}, {'text': 'a'}]
+    todo = manifest.start(chunks)
+    assert [key for key, _ in todo] == [chunk_hash({'text': 'a'}), chunk_hash({'text': 'b'})]
+    manifest.fail(todo[1][0], RuntimeError('boom'))
+    assert manifest.start(chunks, retry_failed=False) == todo[:1]
+    manifest.close()